@@ -0,0 +1,66 @@
+"""Find the latest merge in a deep first-parent history, with and without a
+commit-graph file.
+
+Usage: python -m benchmarks.bench_latest_merge [NUM_COMMITS]
+"""
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pygit2 as pg2
+
+from release.git.client import Repo
+
+from .synth import build_linear
+
+
+def walker_scan(repo: pg2.Repository) -> pg2.Oid:
+    walker = repo.walk(repo.head.target, pg2.GIT_SORT_NONE)
+    walker.simplify_first_parent()
+    for commit in walker:
+        if len(commit.parent_ids) > 1:
+            return commit.id
+
+
+def git(cwd: str, *args: str):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(num_commits: int = 200_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        print(f"Building linear repository with {num_commits} commits...")
+        # the only merge is at the very bottom, so the whole chain is scanned
+        build_linear(path, num_commits, merge_at=10)
+
+        has_git = shutil.which("git") is not None
+        if has_git:
+            git(tmp, "repack", "-adq")
+
+        walker, expected = timed(walker_scan, pg2.Repository(tmp))
+        print(f"revwalk first-parent:   {walker * 1000:9.1f} ms")
+        no_graph, found = timed(Repo(path).find_latest_merge)
+        assert found == expected
+        print(f"without commit-graph:   {no_graph * 1000:9.1f} ms")
+
+        if not has_git:
+            print("git is not installed, skipping commit-graph")
+            return
+        git(tmp, "commit-graph", "write", "--reachable")
+        with_graph, found = timed(Repo(path).find_latest_merge)
+        assert found == expected
+        print(f"with commit-graph:      {with_graph * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""Compare the range walker of Repo.get_shortlog with the previous full walk.
+
+Usage: python -m benchmarks.bench_shortlog [NUM_COMMITS] [RANGE]
+"""
+
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pygit2 as pg2
+
+from release.git.client import Repo
+
+from .synth import build_merge_heavy
+
+
+def previous_shortlog(repo: pg2.Repository, since: pg2.Reference) -> dict:
+    """The walk Repo.get_shortlog did before: default sort, compare every commit
+    against the tag and decode the full message of each one.
+    """
+    shortlog = defaultdict(list)
+    for commit in repo.walk(repo.head.target):
+        if str(commit.id) == str(since.target):
+            break
+        if len(commit.parents) > 1:
+            continue
+        shortlog[commit.committer.name].append(commit.message.splitlines()[0])
+    return shortlog
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(num_commits: int = 100_000, range_size: int = 1_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        print(f"Building merge-heavy repository with {num_commits} commits...")
+        mainline = build_merge_heavy(path, num_commits)
+        raw_repo = pg2.Repository(str(path))
+        tag_commit = mainline[max(0, len(mainline) - range_size)]
+        sig = pg2.Signature("Bench", "bench@example.com")
+        raw_repo.create_tag("annotated", tag_commit, pg2.GIT_OBJECT_COMMIT, sig, "")
+        raw_repo.references.create("refs/tags/lightweight", tag_commit)
+        repo = Repo(path)
+
+        for tag_name in ["lightweight", "annotated"]:
+            since = raw_repo.references[f"refs/tags/{tag_name}"]
+            previous, old_result = timed(previous_shortlog, raw_repo, since)
+            walker, new_result = timed(repo.collect_shortlog, since, False)
+            first_parent, _ = timed(
+                lambda: repo.collect_shortlog(since, False, first_parent_only=True)
+            )
+            old_count = sum(len(s) for s in old_result.values())
+            new_count = sum(len(s) for s in new_result.values())
+            print(f"since {tag_name} tag:")
+            print(f"  previous walk:     {previous * 1000:9.1f} ms ({old_count})")
+            print(f"  range walker:      {walker * 1000:9.1f} ms ({new_count})")
+            print(f"  first-parent only: {first_parent * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""Sum of `python -X importtime` for each subcommand of the release CLI, and
+whether the heavy action back-ends got imported.
+
+Usage: python -m benchmarks.bench_startup [--json]
+"""
+
+import json
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+RELEASE_FILE = """\
+version:
+  from_time: "%Y.%m.%d"
+variables:
+  name: bench
+steps:
+  - title: Check $name
+    run:
+      command: echo $name
+"""
+
+SUBCOMMANDS = [
+    ["--help"],
+    ["validate"],
+    ["start", "--help"],
+    ["tui", "--help"],
+]
+
+HEAVY_MODULES = ["pygit2", "asyncio", "textual", "watchdog", "markdown_it"]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(args, cwd: str) -> dict:
+    root = Path(__file__).resolve().parent.parent
+    code = "from release.cli import main; main()"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        cwd=cwd,
+        env={"PYTHONPATH": str(root), "PATH": ""},
+        capture_output=True,
+        text=True,
+    )
+    total_us = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            total_us += int(match.group(1))
+            modules.add(match.group(4).split(".")[0])
+    return {
+        "command": " ".join(args),
+        "import_ms": total_us / 1000,
+        "num_modules": len(modules),
+        "heavy_modules": [m for m in HEAVY_MODULES if m in modules],
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        Path(tmp, "release.yaml").write_text(RELEASE_FILE)
+        results = [measure(args, tmp) for args in SUBCOMMANDS]
+
+    if "--json" in sys.argv:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        heavy = ", ".join(result["heavy_modules"]) or "-"
+        print(
+            f"release {result['command']:<14} {result['import_ms']:8.1f} ms "
+            f"({result['num_modules']} packages, heavy: {heavy})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark suite of the history walk, tag lookup, config loading, template
+rendering and the TUI, on synthetic repositories and release files built in a
+temporary directory. Results are saved as JSON, and can be compared with the
+results of an earlier run to catch regressions.
+
+Usage:
+    python -m benchmarks.suite [--quick | --full] [-o results.json]
+                               [--compare baseline.json] [--threshold 0.2]
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import pygit2 as pg2
+
+from .synth import add_tags, build_linear, build_merge_heavy, write_release_file
+
+SIZES = {
+    "quick": {"commits": [1_000], "tags": [1_000], "steps": [10, 100]},
+    "default": {
+        "commits": [1_000, 10_000, 100_000],
+        "tags": [1_000, 5_000],
+        "steps": [10, 100, 1_000, 10_000],
+    },
+    "full": {
+        "commits": [1_000, 10_000, 100_000, 1_000_000],
+        "tags": [1_000, 5_000, 20_000],
+        "steps": [10, 100, 1_000, 10_000],
+    },
+}
+RANGE_SIZE = 1_000
+TUI_MOVES = 20
+
+
+def best_of(func: Callable[[], object], repeat: int = 3) -> float:
+    """Fastest of repeat runs in seconds, the least disturbed by other processes."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class Suite:
+    def __init__(self, tmp: Path, sizes: Dict[str, List[int]]):
+        self.tmp = tmp
+        self.sizes = sizes
+        self.results: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.results[name] = seconds
+        print(f"  {name:<40} {seconds * 1000:12.2f} ms", flush=True)
+
+    def run(self):
+        for num_commits in self.sizes["commits"]:
+            self.bench_walk("linear", num_commits)
+            self.bench_walk("merges", num_commits)
+        for num_tags in self.sizes["tags"]:
+            self.bench_tags(num_tags)
+        for num_steps in self.sizes["steps"]:
+            path = write_release_file(self.tmp / f"release-{num_steps}.yaml", num_steps)
+            self.bench_config(path, num_steps)
+            self.bench_render(path, num_steps)
+            self.bench_tui(path, num_steps)
+
+    def bench_walk(self, kind: str, num_commits: int):
+        from release.git.client import Repo
+
+        print(f"Building {kind} repository with {num_commits} commits...")
+        path = self.tmp / f"{kind}-{num_commits}"
+        if kind == "linear":
+            commits = build_linear(path, num_commits)
+        else:
+            commits = build_merge_heavy(path, num_commits)
+        raw_repo = pg2.Repository(str(path))
+        first = raw_repo.references.create("refs/tags/first", commits[0])
+        recent = commits[max(0, len(commits) - RANGE_SIZE)]
+        range_start = raw_repo.references.create("refs/tags/range", recent)
+
+        repo = Repo(path)
+        full = best_of(lambda: repo.collect_shortlog(first, False))
+        self.record(f"walk/{kind}/{num_commits}/full", full)
+        ranged = best_of(lambda: repo.collect_shortlog(range_start, False))
+        self.record(f"walk/{kind}/{num_commits}/range", ranged)
+
+    def bench_tags(self, num_tags: int):
+        from release.git.client import Repo
+
+        print(f"Building repository with {num_tags} tags...")
+        path = self.tmp / f"tags-{num_tags}"
+        commits = build_linear(path, num_tags * 5)
+        add_tags(path, commits, num_tags, annotated_every=3)
+
+        # a new Repo has to build the tag index first
+        cold = best_of(lambda: Repo(path).get_latest_tag())
+        self.record(f"tags/{num_tags}/latest/cold", cold)
+        repo = Repo(path)
+        repo.get_latest_tag()
+        warm = best_of(repo.get_latest_tag)
+        self.record(f"tags/{num_tags}/latest/warm", warm)
+
+    def bench_config(self, path: Path, num_steps: int):
+        from release import config
+
+        print(f"Release file with {num_steps} steps:")
+        cache_dir = config.get_cache_dir("config")
+
+        def load_uncached():
+            for entry in cache_dir.glob("*"):
+                entry.unlink()
+            config.load_release_config(path)
+
+        self.record(f"config/{num_steps}/uncached", best_of(load_uncached))
+        cached = best_of(lambda: config.load_release_config(path))
+        self.record(f"config/{num_steps}/cached", cached)
+
+    def bench_render(self, path: Path, num_steps: int):
+        from release.config import load_release_config, parse_initial_variables
+        from release.parser import compile_template, render_text
+
+        release_config = load_release_config(path)
+        variables = parse_initial_variables(release_config, os.environ)
+        templates = [
+            text for step in release_config.steps for text in step.iter_templates()
+        ]
+
+        def render():
+            for text in templates:
+                render_text(text, variables)
+
+        def render_uncompiled():
+            compile_template.cache_clear()
+            render()
+
+        uncompiled = best_of(render_uncompiled)
+        self.record(f"render/{num_steps}/uncompiled", uncompiled)
+        self.record(f"render/{num_steps}/compiled", best_of(render))
+
+    def bench_tui(self, path: Path, num_steps: int):
+        from release.tui import ReleaseApp
+
+        moves = min(TUI_MOVES, num_steps - 1)
+
+        async def mount_and_navigate():
+            app = ReleaseApp(path)
+            start = time.perf_counter()
+            async with app.run_test() as pilot:
+                await pilot.pause()
+                mounted = time.perf_counter()
+                for _ in range(moves):
+                    await pilot.press("down")
+                await pilot.pause()
+                navigated = time.perf_counter()
+            return mounted - start, (navigated - mounted) / moves
+
+        # moving includes the time the pilot waits for the app to be idle
+        runs = [asyncio.run(mount_and_navigate()) for _ in range(3)]
+        self.record(f"tui/{num_steps}/mount", min(run[0] for run in runs))
+        self.record(f"tui/{num_steps}/move", min(run[1] for run in runs))
+
+
+def get_metadata() -> dict:
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pygit2": pg2.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float):
+    """Print the change of every benchmark in both runs, and return the names of
+    the ones slower than the baseline by more than threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1 if baseline[name] else 0.0
+        marker = ""
+        if change > threshold:
+            regressions.append(name)
+            marker = " !"
+        print(
+            f"{name:<40} {baseline[name] * 1000:10.2f}ms {seconds * 1000:10.2f}ms "
+            f"{change:+8.1%}{marker}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    size_group = parser.add_mutually_exclusive_group()
+    size_group.add_argument("--quick", action="store_true", help="smallest sizes")
+    size_group.add_argument("--full", action="store_true", help="up to 1M commits")
+    parser.add_argument("-o", "--output", type=Path, help="save the results here")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown counted as a regression (default: 0.2, so 20%%)",
+    )
+    args = parser.parse_args()
+    sizes = SIZES["quick" if args.quick else "full" if args.full else "default"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the config cache of the user is left alone
+        os.environ["XDG_CACHE_HOME"] = str(Path(tmp) / "cache")
+        suite = Suite(Path(tmp), sizes)
+        suite.run()
+
+    output = {"metadata": get_metadata(), "results": suite.results}
+    if args.output:
+        args.output.write_text(json.dumps(output, indent=2) + "\n")
+        print(f"\nResults saved to {args.output}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        regressions = compare(suite.results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
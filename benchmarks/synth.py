@@ -0,0 +1,145 @@
+"""Build synthetic git repositories for the benchmarks."""
+
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import pygit2 as pg2
+
+AUTHORS = [f"Author {i}" for i in range(50)]
+MESSAGE = "Change number {n}\n\nSome longer description of the change.\n" * 3
+
+
+def _signature(n: int, start: int) -> pg2.Signature:
+    name = AUTHORS[n % len(AUTHORS)]
+    return pg2.Signature(name, f"{n % len(AUTHORS)}@example.com", start + n, 0)
+
+
+def init_repo(path: Path) -> pg2.Repository:
+    return pg2.init_repository(str(path))
+
+
+def build_linear(
+    path: Path, num_commits: int, tag_every: int = 0, merge_at: Optional[int] = None
+) -> List[pg2.Oid]:
+    """Create a single-branch history, optionally with a lightweight tag on every
+    tag_every-th commit and a merge of a one-commit branch as the merge_at-th
+    commit. Returns the commit ids from oldest to newest.
+    """
+    repo = init_repo(path)
+    tree = repo.TreeBuilder().write()
+    start = int(time.time()) - num_commits
+    parents: List[pg2.Oid] = []
+    commits = []
+    for n in range(num_commits):
+        sig = _signature(n, start)
+        if n == merge_at:
+            side = repo.create_commit(None, sig, sig, "Side\n", tree, parents[:1])
+            parents = parents + [side]
+        oid = repo.create_commit(None, sig, sig, MESSAGE.format(n=n), tree, parents)
+        commits.append(oid)
+        parents = [oid]
+        if tag_every and n % tag_every == 0:
+            repo.references.create(f"refs/tags/v{n}", oid)
+    repo.references.create("refs/heads/main", commits[-1], force=True)
+    repo.set_head("refs/heads/main")
+    return commits
+
+
+def build_merge_heavy(
+    path: Path, num_commits: int, branch_every: int = 10, branch_length: int = 5
+) -> List[pg2.Oid]:
+    """Create a mainline where every branch_every-th commit merges a topic branch
+    of branch_length commits. Returns the mainline commit ids from oldest to newest.
+    """
+    repo = init_repo(path)
+    tree = repo.TreeBuilder().write()
+    start = int(time.time()) - num_commits * 2
+    mainline: List[pg2.Oid] = []
+    head: List[pg2.Oid] = []
+    n = 0
+    while n < num_commits:
+        sig = _signature(n, start)
+        if mainline and len(mainline) % branch_every == 0:
+            topic = head
+            for _ in range(branch_length):
+                n += 1
+                sig = _signature(n, start)
+                msg = MESSAGE.format(n=n)
+                topic = [repo.create_commit(None, sig, sig, msg, tree, topic)]
+            n += 1
+            sig = _signature(n, start)
+            msg = f"Merge topic branch {n}\n"
+            oid = repo.create_commit(None, sig, sig, msg, tree, head + topic)
+        else:
+            oid = repo.create_commit(None, sig, sig, MESSAGE.format(n=n), tree, head)
+        mainline.append(oid)
+        head = [oid]
+        n += 1
+    repo.references.create("refs/heads/main", mainline[-1], force=True)
+    repo.set_head("refs/heads/main")
+    return mainline
+
+
+def add_tags(
+    path: Path, commits: List[pg2.Oid], num_tags: int, annotated_every: int = 0
+):
+    """Tag num_tags commits spread evenly over commits, every annotated_every-th
+    tag as an annotated tag and the rest as lightweight tags.
+    """
+    repo = pg2.Repository(str(path))
+    sig = pg2.Signature("Bench", "bench@example.com")
+    step = max(1, len(commits) // num_tags)
+    for i, oid in enumerate(commits[::step][:num_tags]):
+        name = f"t{i:06d}"
+        if annotated_every and i % annotated_every == 0:
+            repo.create_tag(name, oid, pg2.GIT_OBJECT_COMMIT, sig, f"Tag {name}\n")
+        else:
+            repo.references.create(f"refs/tags/{name}", oid)
+
+
+STEP_TEMPLATES = [
+    """\
+  - title: Build $name part {n}
+    description: |
+      Builds **part {n}** of ${{name}} for version $version.
+    run:
+      command: echo building {n} $name $version
+""",
+    """\
+  - title: Shortlog {n}
+    description: Collect the changes since the latest tag.
+    set_variable: shortlog_{n}
+    git:
+      repo: $repo
+      get_shortlog:
+        include_merge_commits: false
+        since: LATEST_TAG
+""",
+    """\
+  - title: Check {n}
+    description: |
+      - [ ] Check the *changelog* of $name
+      - [ ] Review ${{repo}}
+""",
+]
+
+
+def write_release_file(path: Path, num_steps: int) -> Path:
+    """Release file with num_steps steps: run, git and description-only steps
+    referencing the variables, like a real release file would.
+    """
+    lines = [
+        "version:",
+        '  from_time: "%Y.%m.%d"',
+        "variables:",
+        "  name: bench",
+        "  repo: .",
+        "steps:",
+    ]
+    text = "\n".join(lines) + "\n"
+    text += "".join(
+        STEP_TEMPLATES[n % len(STEP_TEMPLATES)].format(n=n) for n in range(num_steps)
+    )
+    path.write_text(text)
+    return path
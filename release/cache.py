@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, BinaryIO, List, Optional, Union
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class DiskCache:
+    """Directory of files, one per key, written with the serializer (json by
+    default, or anything else with the same dumps and loads functions).
+    Reading an entry touches it, so when the directory grows above max_size bytes,
+    the least recently used entries are removed first. An entry can have a file
+    attached, which is copied as it is instead of serialized, and is removed
+    together with the entry.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int = DEFAULT_MAX_SIZE,
+        serializer: Any = json,
+        suffix: str = ".json",
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._serializer = serializer
+        self._suffix = suffix
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self._suffix}"
+
+    def attachment_path(self, key: str) -> Path:
+        return self.directory / f"{key}{self._suffix}.data"
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.load(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def load(self, key: str) -> Optional[Any]:
+        """Like get, but doesn't count as a hit or miss."""
+        path = self._path(key)
+        try:
+            value = self._serializer.loads(path.read_bytes())
+            os.utime(path)
+        except Exception:
+            # missing, or written by an incompatible version
+            return None
+        return value
+
+    def put(self, key: str, value: Any, attachment: Optional[Path] = None):
+        """Store the value, and a copy of the attachment file when it's given."""
+        data = self._serializer.dumps(value)
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if attachment is not None:
+                self._write(self.attachment_path(key), attachment.open("rb"))
+            self._write(self._path(key), data)
+        except OSError:
+            # caching is best effort, e.g. the directory can be read-only
+            return
+        self.evict()
+
+    def _write(self, path: Path, data: Union[bytes, BinaryIO]):
+        # write to a temporary file first, so concurrent readers never see
+        # a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                with data:
+                    shutil.copyfileobj(data, f)
+        os.replace(tmp_path, path)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Keys starting with prefix, most recently used first."""
+        paths = self.directory.glob(f"{prefix}*{self._suffix}")
+        paths = sorted(paths, key=_mtime, reverse=True)
+        return [p.name.removesuffix(self._suffix) for p in paths]
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob(f"*{self._suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            attachment = path.with_name(path.name + ".data")
+            size = stat.st_size + _size(attachment)
+            entries.append((stat.st_mtime, size, path, attachment))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, path, attachment in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            attachment.unlink(missing_ok=True)
+            total_size -= size
+
+    @property
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def get_cache_dir(name: str) -> Path:
+    """Directory for a cache of the user, shared by every release file."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "release-py" / name
@@ -1,11 +1,16 @@
+import contextlib
+import json
 import os
 from pathlib import Path
+from typing import Optional, Tuple
 
 import click
+import yaml
 from pydantic import ValidationError
 
-from .config import load_release_config, parse_initial_variables
-from .steps import run_steps
+from . import profiling
+from .config import format_timings, load_release_config, parse_initial_variables
+from .types import Variables
 
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]})
@@ -15,45 +20,297 @@ from .steps import run_steps
     type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
     default="release.yaml",
 )
+@click.option(
+    "--timings",
+    is_flag=True,
+    help="Print how long parsing and validating the release file took",
+)
 @click.pass_context
-def main(ctx: click.Context, release_file: Path):
+def main(ctx: click.Context, release_file: Path, timings: bool):
     # ensure that ctx.obj exists and is a dict
     # in case main() is called by other means
     ctx.ensure_object(dict)
     ctx.obj["release_file"] = release_file
+    ctx.obj["timings"] = {} if timings else None
+
+
+def parse_overrides(ctx: click.Context, param: click.Parameter, values) -> Variables:
+    overrides = {}
+    for value in values:
+        name, sep, value = value.partition("=")
+        if not sep:
+            raise click.BadParameter(f"{name!r} is not in NAME=VALUE format")
+        overrides[name] = value
+    return overrides
+
+
+profile_option = click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write a Chrome trace of the run to this file, and a summary next to it",
+)
+
+
+@contextlib.contextmanager
+def profile(profile_path: Optional[Path]):
+    """Record spans while running the block if profile_path is given."""
+    if profile_path is None:
+        yield
+        return
+    profiler = profiling.enable()
+    try:
+        yield
+    finally:
+        profiling.disable()
+        summary_path = profiler.write(profile_path)
+        click.echo(f"Profile written to {profile_path} and {summary_path}", err=True)
+
+
+def echo_timings(ctx: click.Context):
+    timings = ctx.obj["timings"]
+    if timings is not None:
+        click.echo(format_timings(timings), err=True)
+
+
+def echo_shortlog_cache_stats(ctx: click.Context, profile_path: Optional[Path]):
+    """With --timings or --profile, how the shortlog caches of git steps did."""
+    if ctx.obj["timings"] is None and profile_path is None:
+        return
+    from .git.cache import get_cache_stats
+
+    for line in get_cache_stats():
+        click.echo(line, err=True)
 
 
 @main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--non-interactive",
+    is_flag=True,
+    help="Don't wait for enter after steps, run independent steps concurrently",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Maximum number of steps running at once with --non-interactive",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the steps which finished in the previous run, according to its journal",
+)
+@click.option(
+    "--var",
+    "overrides",
+    multiple=True,
+    metavar="NAME=VALUE",
+    callback=parse_overrides,
+    help="Set a variable instead of the value in the release file",
+)
+@click.option(
+    "--journal",
+    "journal_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Journal of the run  [default: next to the release file]",
+)
+@profile_option
 @click.pass_context
-def start(ctx: click.Context):
+def start(
+    ctx: click.Context,
+    non_interactive: bool,
+    jobs: int,
+    resume: bool,
+    overrides: Variables,
+    journal_path: Optional[Path],
+    profile_path: Optional[Path],
+):
+    try:
+        with profile(profile_path):
+            _start(ctx, non_interactive, jobs, resume, overrides, journal_path)
+    finally:
+        echo_shortlog_cache_stats(ctx, profile_path)
+
+
+def _start(
+    ctx: click.Context,
+    non_interactive: bool,
+    jobs: int,
+    resume: bool,
+    overrides: Variables,
+    journal_path: Optional[Path],
+):
+    # the step runners and their action back-ends are only needed here
+    from .journal import Journal, get_journal_path
+    from .python import start_worker_pool
+    from .scheduler import run_steps_concurrently
+    from .steps import run_steps
+
     release_file = ctx.obj["release_file"]
     if not release_file.exists():
         raise click.UsageError(f"Release file '{release_file}' does not exist")
     try:
-        config = load_release_config(release_file)
+        config = load_release_config(release_file, ctx.obj["timings"])
     except ValidationError as e:
         raise click.UsageError(str(e))
-    variables = parse_initial_variables(config, os.environ)
+    echo_timings(ctx)
+    journal = Journal(journal_path or get_journal_path(release_file))
+    state = journal.replay() if resume else None
+    if state and state.variables is not None:
+        # the same version and initial variables as the interrupted run
+        variables = state.variables
+        completed = state.get_completed(config.steps)
+    else:
+        if resume:
+            click.secho("No previous run to resume", fg="yellow")
+        variables = parse_initial_variables(config, os.environ, overrides)
+        completed = {}
+        journal.begin(variables)
+    if any(step.python and step.python.isolated for step in config.steps):
+        start_worker_pool()
     try:
-        run_steps(config.steps, variables)
+        if non_interactive:
+            run_steps_concurrently(config.steps, variables, jobs, journal, completed)
+        else:
+            run_steps(config.steps, variables, journal, completed)
     except Exception as e:
         click.secho(f"\n{e}", fg="red")
         ctx.exit(1)
+    else:
+        journal.complete()
+    finally:
+        journal.close()
 
 
 @main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument(
+    "directories",
+    nargs=-1,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-m",
+    "--matrix",
+    "matrix_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="YAML list of variable sets, or of instances with name, dir and variables",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Maximum number of instances running at once",
+)
+@click.option(
+    "--log-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=".release-matrix",
+    show_default=True,
+    help="Directory of the logs and journals of the instances",
+)
 @click.pass_context
-def validate(ctx: click.Context):
+def matrix(
+    ctx: click.Context,
+    directories: Tuple[Path, ...],
+    matrix_file: Optional[Path],
+    jobs: int,
+    log_dir: Path,
+):
+    """Run the release file non-interactively for every variable set of the
+    matrix file and in every directory, at most jobs of them at once.
+    """
+    from .matrix import (
+        MatrixInstance,
+        format_summary,
+        load_matrix_file,
+        run_matrix,
+    )
+
     release_file = ctx.obj["release_file"]
     if not release_file.exists():
         raise click.UsageError(f"Release file '{release_file}' does not exist")
-    click.echo(f"Validating {release_file.resolve()}")
-    try:
-        load_release_config(release_file)
-    except ValidationError as e:
-        click.secho(e, fg="yellow")
+    instances = [MatrixInstance(dir=directory) for directory in directories]
+    if matrix_file:
+        try:
+            instances += load_matrix_file(matrix_file)
+        except (ValueError, yaml.YAMLError) as e:
+            raise click.UsageError(str(e))
+    if not instances:
+        raise click.UsageError("Specify directories or a matrix file")
+
+    results = run_matrix(instances, release_file, log_dir, jobs)
+    click.echo()
+    click.echo(format_summary(results))
+    if any(result.returncode != 0 for result in results):
         ctx.exit(1)
+
+
+@main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument("files", nargs=-1)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    help="Print the results as text, or as JSON for other tools",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of files validated at once (default: number of CPUs)",
+)
+@click.pass_context
+def validate(
+    ctx: click.Context, files: Tuple[str, ...], output_format: str, jobs: Optional[int]
+):
+    """Validate the release file, or every file and glob pattern in FILES.
+    Also checks that the variables used by the steps are defined before them.
+    """
+    from .validation import expand_paths, validate_file, validate_files
+
+    if files:
+        paths = expand_paths(files)
+        if not paths:
+            raise click.UsageError(f"No files match {' '.join(files)}")
+    else:
+        release_file = ctx.obj["release_file"]
+        if not release_file.exists():
+            raise click.UsageError(f"Release file '{release_file}' does not exist")
+        paths = [release_file]
+
+    if len(paths) == 1:
+        results = [validate_file(paths[0], ctx.obj["timings"])]
+        echo_timings(ctx)
+    else:
+        results = validate_files(paths, jobs)
+
+    if output_format == "json":
+        click.echo(json.dumps(results, indent=2))
     else:
+        for result in results:
+            echo_validation_result(result)
+    if not all(result["valid"] for result in results):
+        ctx.exit(1)
+
+
+def echo_validation_result(result: dict):
+    click.echo(f"Validating {Path(result['path']).resolve()}")
+    for error in result["errors"]:
+        loc = ".".join(str(part) for part in error["loc"])
+        click.secho(
+            f"  {loc}: {error['message']}" if loc else f"  {error['message']}",
+            fg="yellow",
+        )
+    for problem in result["problems"]:
+        where = f"step {problem['step']}" if problem["step"] else "variables"
+        color = "red" if problem["severity"] == "error" else "yellow"
+        click.secho(f"  {where}: {problem['message']}", fg=color)
+    if result["valid"]:
         click.echo("Configuration file seems valid!")
 
 
@@ -61,10 +318,22 @@ def validate(ctx: click.Context):
 @click.option(
     "--restart-on-change",
     is_flag=True,
-    help="Restart the TUI when Python files in the release package change",
+    help="Restart the TUI when Python files in the release package change, and "
+    "reload the release file when it changes",
 )
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the steps which finished in the previous run, according to its journal",
+)
+@profile_option
 @click.pass_context
-def tui(ctx: click.Context, restart_on_change: bool):
+def tui(
+    ctx: click.Context,
+    restart_on_change: bool,
+    resume: bool,
+    profile_path: Optional[Path],
+):
     import importlib
 
     from . import tui
@@ -76,31 +345,36 @@ def tui(ctx: click.Context, restart_on_change: bool):
     # Initialize state that persists across restarts
     persistent_state = {"current_step_index": 0, "variables": None}
 
-    while True:
-        try:
-            app = tui.ReleaseApp(
-                config_path=release_file,
-                restart_on_change=restart_on_change,
-                initial_state=persistent_state,
-            )
-            app.run()
-
-            # If restart_on_change is disabled or app didn't request restart, exit
-            if not restart_on_change or not getattr(app, "should_restart", False):
-                break
-
-            # Preserve state for next restart
-            persistent_state = app.get_state()
-            importlib.reload(tui)
-
-            # Brief pause before restart to avoid rapid restarts
-            import time
-
-            time.sleep(0.1)
-
-        except ValidationError as e:
-            click.secho(f"Configuration error: {e}", fg="red")
-            ctx.exit(1)
-        except Exception as e:
-            click.secho(f"Error: {e}", fg="red")
-            ctx.exit(1)
+    with profile(profile_path):
+        while True:
+            try:
+                app = tui.ReleaseApp(
+                    config_path=release_file,
+                    restart_on_change=restart_on_change,
+                    initial_state=persistent_state,
+                    config_timings=ctx.obj["timings"],
+                    resume=resume,
+                )
+                app.run()
+                echo_timings(ctx)
+
+                # If restart_on_change is disabled or app didn't request restart, exit
+                if not restart_on_change or not getattr(app, "should_restart", False):
+                    break
+
+                # Preserve state for next restart
+                persistent_state = app.get_state()
+                importlib.reload(tui)
+
+                # Brief pause before restart to avoid rapid restarts
+                import time
+
+                time.sleep(0.1)
+
+            except ValidationError as e:
+                click.secho(f"Configuration error: {e}", fg="red")
+                ctx.exit(1)
+            except Exception as e:
+                click.secho(f"Error: {e}", fg="red")
+                ctx.exit(1)
+    echo_shortlog_cache_stats(ctx, profile_path)
@@ -1,15 +1,34 @@
 import datetime as dt
+import functools
+import hashlib
+import importlib.metadata
+import os
+import pickle
+import sys
+import time
+import typing
 from pathlib import Path
-from typing import List, Mapping, Optional
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
 
+import pydantic
 import yaml
 from pydantic import BaseModel, root_validator, validator
 
+from . import profiling
+from .cache import DiskCache, get_cache_dir
 from .git import GitConfig
+from .gitlab import GitlabConfig
 from .parser import render_with_envvars
+from .python import PythonConfig
 from .runner import RunConfig
 from .types import Variables
 
+# the C implementation is much faster, when PyYAML was built with libyaml
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# fields of Step which are actions, a Step can have only one of them
+ACTIONS = ("git", "run", "python", "gitlab")
+
 
 class Version(BaseModel):
     from_time: Optional[str]
@@ -21,22 +40,122 @@ class Version(BaseModel):
         return v
 
 
+class StepCacheConfig(BaseModel):
+    # names of the environment variables the result of the step depends on
+    env: List[str] = []
+
+
+class Environment(BaseModel):
+    name: str
+    # added to the variables of the step when it runs in this environment
+    variables: Dict[str, str] = {}
+
+    @validator("variables")
+    def validate_names(cls, v: Dict[str, str]):
+        if "environment" in v:
+            raise ValueError("'environment' is set to the name of the environment")
+        return v
+
+
+class RolloutConfig(BaseModel):
+    # number of environments the step runs in at once
+    concurrency: int = 4
+    # the first environments, which have to succeed before the others start
+    canary: int = 0
+    # the environments after the canaries run in batches of this size, each
+    # batch after the previous one succeeded, or all at once without it
+    batch_size: Optional[int] = None
+
+    @validator("concurrency", "batch_size")
+    def validate_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("has to be at least 1")
+        return v
+
+
 class Step(BaseModel):
     # TODO: make title and desc optional
+    id: Optional[str] = None
     title: str
     description: Optional[str] = None
     git: Optional[GitConfig] = None
     set_variable: Optional[str] = None
     run: Optional[RunConfig] = None
-    gitlab: Optional[dict] = None
-    environments: Optional[list] = None
+    python: Optional[PythonConfig] = None
+    gitlab: Optional[GitlabConfig] = None
+    # run the action once for every environment, with the variables of the
+    # environment and $environment set to its name
+    environments: Optional[List[Environment]] = None
+    rollout: RolloutConfig = RolloutConfig()
     checklist: Optional[list] = None
+    # opened in the browser after the action, or on its own without one
     open_url: Optional[str] = None
+    # ids of earlier steps which have to finish before this one when running
+    # steps concurrently, in addition to the ones inferred from variables
+    depends_on: List[str] = []
+    # reuse the output of the step when its inputs didn't change
+    cache: Optional[StepCacheConfig] = None
 
     @property
     def has_action(self):
-        # currently git is the only action-type field
-        return self.git is not None
+        return self.action is not None or self.open_url is not None
+
+    @property
+    def action(self) -> Optional[str]:
+        return next((a for a in ACTIONS if getattr(self, a) is not None), None)
+
+    def iter_templates(self) -> Iterator[str]:
+        """Every field which is rendered with the variables."""
+        for _, text in self.iter_tagged_templates():
+            yield text
+
+    def iter_tagged_templates(self) -> Iterator[Tuple[str, str]]:
+        """Every field which is rendered with the variables, with its kind:
+        "display" for the title and description, which are only shown, and
+        "action" for the fields the action runs with.
+        """
+        yield "display", self.title
+        if self.description:
+            yield "display", self.description
+        for text in self._iter_action_templates():
+            yield "action", text
+
+    def _iter_action_templates(self) -> Iterator[str]:
+        if self.git:
+            yield from self.git.iter_templates()
+        if self.run:
+            yield from self.run.iter_templates()
+        if self.gitlab:
+            yield from self.gitlab.iter_templates()
+        if self.open_url:
+            yield self.open_url
+        for env in self.environments or []:
+            yield from env.variables.values()
+
+    @validator("environments", pre=True, each_item=True)
+    def environment_name(cls, v):
+        # "- eu-west" is an environment with only a name
+        if isinstance(v, str):
+            return {"name": v}
+        return v
+
+    @validator("environments")
+    def validate_environments(cls, v: Optional[List[Environment]]):
+        if v is not None:
+            names = [env.name for env in v]
+            duplicates = sorted({name for name in names if names.count(name) > 1})
+            if duplicates:
+                raise ValueError(f"duplicate environments: {', '.join(duplicates)}")
+        return v
+
+    @validator("cache", pre=True)
+    def enable_cache(cls, v):
+        # "cache: true" enables caching with the default settings
+        if v is True:
+            return {}
+        if v is False:
+            return None
+        return v
 
     @validator("title")
     def strip_title(cls, v: str) -> str:
@@ -50,17 +169,19 @@ class Step(BaseModel):
 
     @root_validator(pre=True)
     def validate_only_one_action(cls, values):
-        if "git" in values and "run" in values:
+        actions = [action for action in ACTIONS if action in values]
+        if len(actions) > 1:
+            specified = " and ".join(f'"{action}"' for action in actions)
             raise ValueError(
                 "Only 1 action can be specified for a Step at once.\n"
-                '  Specified actions: "git" and "run".'
+                f"  Specified actions: {specified}."
             )
         return values
 
 
 class ReleaseConfig(BaseModel):
     version: Version
-    variables: Variables
+    variables: Dict[str, str]
     steps: List[Step]
 
     @validator("steps", each_item=True)
@@ -69,11 +190,123 @@ class ReleaseConfig(BaseModel):
             raise ValueError(f"has no action, but variable {v.set_variable!r} is set")
         return v
 
+    @validator("steps", each_item=True)
+    def validate_cache(cls, v: Step):
+        if not v.has_action and v.cache:
+            raise ValueError("has no action, but cache is set")
+        return v
+
+    @validator("steps", each_item=True)
+    def validate_environments(cls, v: Step):
+        if not v.has_action and v.environments:
+            raise ValueError("has no action, but environments are set")
+        return v
+
+    @validator("steps")
+    def validate_depends_on(cls, v: List[Step]):
+        step_ids = set()
+        for step in v:
+            for step_id in step.depends_on:
+                if step_id not in step_ids:
+                    raise ValueError(
+                        f"{step.title!r} depends on {step_id!r}, "
+                        "which is not the id of an earlier step"
+                    )
+            if step.id in step_ids:
+                raise ValueError(f"Step id {step.id!r} is not unique")
+            if step.id:
+                step_ids.add(step.id)
+        return v
+
+
+def _iter_models(annotation) -> Iterator[type]:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        yield annotation
+    for arg in typing.get_args(annotation):
+        yield from _iter_models(arg)
+
+
+def get_model_modules() -> List[str]:
+    """Modules defining ReleaseConfig and the models of its fields, a change in
+    them invalidates the cached configs.
+    """
+    models = {ReleaseConfig}
+    pending = [ReleaseConfig]
+    while pending:
+        model = pending.pop()
+        for field in model.__fields__.values():
+            for field_model in _iter_models(field.annotation):
+                if field_model not in models:
+                    models.add(field_model)
+                    pending.append(field_model)
+    return sorted({model.__module__ for model in models})
+
+
+def get_package_version() -> str:
+    try:
+        return importlib.metadata.version("release-py")
+    except importlib.metadata.PackageNotFoundError:
+        # running from a source checkout, the module sources are hashed anyway
+        return ""
+
+
+@functools.lru_cache(maxsize=None)
+def get_models_hash() -> bytes:
+    digest = hashlib.sha256(sys.version.encode())
+    # pickled configs depend on the pydantic internals too
+    digest.update(pydantic.VERSION.encode())
+    digest.update(get_package_version().encode())
+    for module_name in get_model_modules():
+        digest.update(Path(sys.modules[module_name].__file__).read_bytes())
+    return digest.digest()
+
+
+def get_config_key(content: bytes) -> str:
+    # RunConfig.chdir defaults to the working directory
+    digest = hashlib.sha256(get_models_hash())
+    digest.update(os.fsencode(Path.cwd()))
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def load_release_config(
+    path: Path, timings: Optional[Dict[str, float]] = None
+) -> "ReleaseConfig":
+    """Load the release file, or its validated ReleaseConfig from the cache when
+    a file with the same content was loaded before.
+    Durations of the phases in seconds are stored in timings if given.
+    """
+    timings = {} if timings is None else timings
+    with profiling.span("config.load", path=str(path)) as load_span:
+        start = time.perf_counter()
+        content = path.read_bytes()
+        key = get_config_key(content)
+        cache = DiskCache(get_cache_dir("config"), serializer=pickle, suffix=".pickle")
+        config = cache.get(key)
+        timings["read"] = time.perf_counter() - start
+        load_span.set(cached=config is not None)
+        if config is not None:
+            return config
+
+        start = time.perf_counter()
+        with profiling.span("config.parse"):
+            release_dict = yaml.load(content, Loader=YamlLoader)
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with profiling.span("config.validate"):
+            config = ReleaseConfig.parse_obj(release_dict)
+        timings["validate"] = time.perf_counter() - start
+
+        cache.put(key, config)
+        return config
+
 
-def load_release_config(path: Path) -> "ReleaseConfig":
-    with path.open("r") as f:
-        release_dict = yaml.safe_load(f)
-    return ReleaseConfig.parse_obj(release_dict)
+def format_timings(timings: Dict[str, float]) -> str:
+    phases = ", ".join(f"{name} {sec * 1000:.1f} ms" for name, sec in timings.items())
+    if "parse" not in timings:
+        phases += ", cache hit"
+    return f"Loaded release file in {sum(timings.values()) * 1000:.1f} ms ({phases})"
 
 
 def parse_version(version: Version) -> str:
@@ -86,10 +319,17 @@ def parse_version(version: Version) -> str:
 
 
 def parse_initial_variables(
-    config: "ReleaseConfig", env: Mapping[str, str]
+    config: "ReleaseConfig",
+    env: Mapping[str, str],
+    overrides: Optional[Variables] = None,
 ) -> Variables:
-    version = parse_version(config.version)
-    variables = {"version": version}
+    """Variables of the release file rendered in order. Values in overrides are
+    used instead of the ones in the file, and can be referenced by them.
+    """
+    overrides = overrides or {}
+    version = overrides.get("version") or parse_version(config.version)
+    variables = {"version": version, **overrides}
     for name, value in config.variables.items():
-        variables[name] = render_with_envvars(value, variables, env)
+        if name not in overrides:
+            variables[name] = render_with_envvars(value, variables, env)
     return variables
@@ -1,2 +1,16 @@
 from .config import GitConfig as GitConfig
-from .run import run_step as run_step
+
+
+def __getattr__(name: str):
+    # pygit2 is only imported when a git step actually runs
+    if name in ("run_step", "get_repo_paths", "get_repo_state", "get_worktree_state"):
+        from .run import get_repo_paths, get_repo_state, get_worktree_state, run_step
+
+        globals().update(
+            run_step=run_step,
+            get_repo_paths=get_repo_paths,
+            get_repo_state=get_repo_state,
+            get_worktree_state=get_worktree_state,
+        )
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,137 @@
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pygit2 as pg2
+
+from ..cache import DEFAULT_MAX_SIZE, DiskCache
+from .client import OnProgress, Repo, Shortlog, Since, merge_shortlogs
+from .config import GetShortlogConfig
+
+_caches: Dict[Path, "ShortlogCache"] = {}
+_caches_lock = threading.Lock()
+# hits, misses and extended shortlogs of the caches in worker processes
+_worker_counts = [0, 0, 0]
+
+Counts = Tuple[int, int, int]
+
+
+class ShortlogCache:
+    """Aggregated shortlogs stored on disk by (since, HEAD, walk options).
+    History below a commit never changes, so an entry is valid forever. When HEAD
+    moved forward since an earlier run, only the new commits are walked and merged
+    into the cached shortlog of the previous HEAD.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE):
+        self._cache = DiskCache(directory, max_size)
+        self.extended = 0
+
+    @staticmethod
+    def _prefix(since_id: pg2.Oid, conf: GetShortlogConfig) -> str:
+        merges = int(conf.include_merge_commits)
+        first_parent = int(conf.first_parent_only)
+        return f"{since_id}-{merges}-{conf.sort.value}-{first_parent}-"
+
+    def collect(
+        self,
+        repo: Repo,
+        since: Since,
+        conf: GetShortlogConfig,
+        on_progress: Optional[OnProgress] = None,
+    ) -> Shortlog:
+        since_id = repo.get_commit_id(since)
+        head_id = repo.head_id
+        prefix = self._prefix(since_id, conf)
+        key = f"{prefix}{head_id}"
+
+        shortlog = self._cache.get(key)
+        if shortlog is not None:
+            return shortlog
+
+        shortlog = self._extend_previous(
+            repo, since_id, head_id, prefix, conf, on_progress
+        )
+        if shortlog is None:
+            commits = repo.walk(head_id, [since_id], conf.sort, conf.first_parent_only)
+            shortlog = repo.aggregate_shortlog(
+                commits, conf.include_merge_commits, on_progress
+            )
+
+        self._cache.put(key, shortlog)
+        return shortlog
+
+    def _extend_previous(
+        self,
+        repo: Repo,
+        since_id: pg2.Oid,
+        head_id: pg2.Oid,
+        prefix: str,
+        conf: GetShortlogConfig,
+        on_progress: Optional[OnProgress],
+    ) -> Optional[Shortlog]:
+        # the first-parent chain of the new HEAD doesn't necessarily go through
+        # the previous HEAD, so that range can't be extended
+        if conf.first_parent_only:
+            return None
+
+        for key in self._cache.keys(prefix):
+            previous_head = pg2.Oid(hex=key.removeprefix(prefix))
+            if not repo.is_ancestor(previous_head, head_id):
+                continue
+            previous = self._cache.load(key)
+            if previous is None:
+                continue
+            hidden = [since_id, previous_head]
+            commits = repo.walk(head_id, hidden, conf.sort)
+            new = repo.aggregate_shortlog(
+                commits, conf.include_merge_commits, on_progress
+            )
+            self.extended += 1
+            return merge_shortlogs(new, previous)
+
+        return None
+
+    @property
+    def counts(self) -> Counts:
+        return self._cache.hits, self._cache.misses, self.extended
+
+    @property
+    def stats(self) -> str:
+        return format_stats(self.counts)
+
+
+def format_stats(counts: Counts) -> str:
+    hits, misses, extended = counts
+    return f"{hits} hits, {misses} misses, {extended} extended"
+
+
+def get_shortlog_cache(repo: Repo, cache_dir: Optional[Path]) -> ShortlogCache:
+    """Shortlog cache of the directory, shared in the whole process.
+    By default it is stored in the .git directory of the repository.
+    """
+    directory = (cache_dir or repo.git_dir / "release-py" / "shortlog").resolve()
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = ShortlogCache(directory)
+        return _caches[directory]
+
+
+def add_worker_counts(counts: Counts):
+    """Count the cache use of a shortlog collected in a worker process."""
+    with _caches_lock:
+        for i, count in enumerate(counts):
+            _worker_counts[i] += count
+
+
+def get_cache_stats() -> List[str]:
+    """Stats of the shortlog caches used in this process and its workers."""
+    with _caches_lock:
+        lines = [
+            f"Shortlog cache {directory}: {cache.stats}"
+            for directory, cache in _caches.items()
+        ]
+        if any(_worker_counts):
+            stats = format_stats(tuple(_worker_counts))
+            lines.append(f"Shortlog cache in worker processes: {stats}")
+        return lines
@@ -1,53 +1,301 @@
-from collections import defaultdict
+import threading
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import pygit2 as pg2
 
+from .. import profiling
+from .commitgraph import CommitGraph
+from .config import SortOrder
+from .tags import Signature, TagIndex, get_signature
+
+# author name -> commit subjects, newest first
+Shortlog = Dict[str, List[str]]
+# a tag reference or a commit id
+Since = Union[pg2.Reference, pg2.Oid]
+# called with the number of commits walked so far
+OnProgress = Callable[[int], None]
+
+PROGRESS_INTERVAL = 1000
+
+SORT_MODES = {
+    SortOrder.TIME: pg2.GIT_SORT_TIME,
+    SortOrder.TOPOLOGICAL: pg2.GIT_SORT_TOPOLOGICAL | pg2.GIT_SORT_TIME,
+    SortOrder.NONE: pg2.GIT_SORT_NONE,
+}
+
 
 class Repo:
     """Wrapper above pygit2 for specific git operation common at release.
     Like git shortlog, getting references, tagging, etc.
+    A Repo is shared by the threads of the steps, the cached tag index and
+    commit-graph are loaded under a lock. The commit-graph is never replaced
+    while the Repo is open: history only grows, so a stale one is still right,
+    and newer commits are read from the object database.
     """
 
     def __init__(self, path: Path):
-        self._repo = pg2.Repository(path.resolve())
+        with profiling.span("git.open", path=str(path)):
+            self._repo = pg2.Repository(path.resolve())
+        self._lock = threading.RLock()
+        self._tag_index: Optional[TagIndex] = None
+        self._tag_index_signature: Optional[Signature] = None
+        self._latest_tags: Dict[Tuple[pg2.Oid, bool], str] = {}
+        self._commit_graph: Optional[CommitGraph] = None
+        self._commit_graph_loaded = False
+
+    def close(self):
+        """Only called when no step uses the Repo anymore, at exit."""
+        with self._lock:
+            if self._commit_graph is not None:
+                self._commit_graph.close()
+            self._commit_graph = None
+        self._repo.free()
 
-    def get_tag_ref(self, long_tag_name: str) -> pg2.Reference:
-        tag_name = long_tag_name.split("-", 1)[0]
+    def get_tag_ref(self, tag_name: str) -> pg2.Reference:
         return self._repo.references[f"refs/tags/{tag_name}"]
 
-    def get_latest_tag(self) -> pg2.Reference:
-        tag_name = self._repo.describe(
-            describe_strategy=pg2.GIT_DESCRIBE_TAGS, always_use_long_format=True
-        )
+    def get_tag_index(self) -> TagIndex:
+        """Build the tag index once, and rebuild only when tags changed."""
+        signature = get_signature(self.git_dir)
+        with self._lock:
+            if self._tag_index is None or signature != self._tag_index_signature:
+                with profiling.span("git.tag_index"):
+                    self._tag_index = TagIndex(self._repo)
+                self._tag_index_signature = signature
+                self._latest_tags.clear()
+            return self._tag_index
+
+    def _find_latest_tag(self, annotated_only: bool) -> pg2.Reference:
+        head_id = self.head_id
+        key = (head_id, annotated_only)
+        with self._lock:
+            tag_index = self.get_tag_index()
+            if key not in self._latest_tags:
+                with profiling.span("git.latest_tag", annotated_only=annotated_only):
+                    tag_name = tag_index.find_latest(
+                        self._repo, head_id, annotated_only
+                    )
+                if tag_name is None:
+                    kind = "annotated tag" if annotated_only else "tag"
+                    raise ValueError(f"No {kind} found in the history of HEAD")
+                self._latest_tags[key] = tag_name
+            tag_name = self._latest_tags[key]
         return self.get_tag_ref(tag_name)
 
+    def get_latest_tag(self) -> pg2.Reference:
+        return self._find_latest_tag(annotated_only=False)
+
     def get_latest_annotated_tag(self) -> pg2.Reference:
-        tag_name = self._repo.describe(always_use_long_format=True)
-        return self.get_tag_ref(tag_name)
+        return self._find_latest_tag(annotated_only=True)
+
+    def get_commit_graph(self) -> Optional[CommitGraph]:
+        with self._lock:
+            if not self._commit_graph_loaded:
+                self._commit_graph = CommitGraph.open(self.git_dir)
+                self._commit_graph_loaded = True
+            return self._commit_graph
+
+    def iter_first_parent_merges(
+        self, head: pg2.Oid, stop: Optional[pg2.Oid] = None
+    ) -> Iterator[Tuple[pg2.Oid, List[pg2.Oid]]]:
+        """Follow the first parents from head and yield the merge commits on the way
+        with their other parents, until stop or the root commit is reached.
+        """
+        graph = self.get_commit_graph()
+        commit_id = head
+        # commits newer than the commit-graph file have to be read from the odb
+        while graph is None or (position := graph.lookup(commit_id.raw)) is None:
+            if commit_id == stop:
+                return
+            parent_ids = self._repo[commit_id].parent_ids
+            if len(parent_ids) > 1:
+                yield commit_id, parent_ids[1:]
+            if not parent_ids:
+                return
+            commit_id = parent_ids[0]
+
+        stop_position = graph.lookup(stop.raw) if stop is not None else None
+        while position != stop_position:
+            parents = graph.get_parents(position)
+            if len(parents) > 1:
+                commit_id = pg2.Oid(raw=graph.get_oid(position))
+                other_parents = [pg2.Oid(raw=graph.get_oid(p)) for p in parents[1:]]
+                yield commit_id, other_parents
+            if not parents:
+                return
+            position = parents[0]
+
+    def _contains(self, commit_id: pg2.Oid, ancestor: pg2.Oid) -> bool:
+        graph = self.get_commit_graph()
+        if graph is not None and commit_id != ancestor:
+            # a commit can only reach commits with lower generation numbers
+            position = graph.lookup(commit_id.raw)
+            ancestor_position = graph.lookup(ancestor.raw)
+            if position is not None and ancestor_position is not None:
+                generation = graph.get_generation(position)
+                ancestor_generation = graph.get_generation(ancestor_position)
+                if 0 < generation <= ancestor_generation:
+                    return False
+        return self.is_ancestor(ancestor, commit_id)
+
+    def find_latest_merge(self, branch: Optional[str] = None) -> pg2.Oid:
+        """The nearest merge commit in the first-parent history of HEAD.
+        With branch, the nearest merge which brought in the merge base of HEAD and
+        the branch, or the merge base itself if the branch was never merged.
+        """
+        with profiling.span("git.latest_merge", branch=branch):
+            return self._find_latest_merge(branch)
+
+    def _find_latest_merge(self, branch: Optional[str]) -> pg2.Oid:
+        if branch is None:
+            for merge_id, _ in self.iter_first_parent_merges(self.head_id):
+                return merge_id
+            raise ValueError("No merge commit found in the history of HEAD")
+
+        branch_id = self._repo.revparse_single(branch).peel(pg2.Commit).id
+        merge_base = self._repo.merge_base(self.head_id, branch_id)
+        if merge_base is None:
+            raise ValueError(f"HEAD and {branch!r} have no common history")
+
+        # the merge where the merge base enters the first-parent history: a later
+        # merge of another branch forked after it can contain the merge base too
+        merges = self.iter_first_parent_merges(self.head_id, stop=merge_base)
+        for merge_id, other_parents in merges:
+            if any(self._contains(p, merge_base) for p in other_parents):
+                first_parent = self._repo[merge_id].parent_ids[0]
+                if not self._contains(first_parent, merge_base):
+                    return merge_id
+        return merge_base
 
     @staticmethod
     def is_merge_commit(commit: pg2.Commit):
         # A merge commit is a commit with multiple parents
-        return len(commit.parents) > 1
-
-    def get_shortlog(self, since: pg2.Reference, include_merge_commits: bool) -> str:
-        shortlog = defaultdict(list)
-
-        commits = self._repo.walk(self._repo.head.target)
-        for commit in commits:
-            if commit.hex == str(since.target):
-                break
-            if not include_merge_commits and self.is_merge_commit(commit):
-                continue
-            first_line = commit.message.splitlines()[0]
-            shortlog[commit.committer.name].append(first_line)
-
-        lines = []
-        for name, commits in shortlog.items():
-            lines.append(f"{name} ({len(commits)}):")
-            for commit in commits:
-                lines.append(f"      {commit}")
-            lines.append("")
-
-        return "\n".join(lines)
+        return len(commit.parent_ids) > 1
+
+    @staticmethod
+    def get_subject(commit: pg2.Commit) -> str:
+        # only decode the first line instead of the whole message
+        first_line = commit.raw_message.split(b"\n", 1)[0]
+        return first_line.decode(commit.message_encoding or "utf-8", "replace")
+
+    @property
+    def head_id(self) -> pg2.Oid:
+        return self._repo.head.target
+
+    @property
+    def git_dir(self) -> Path:
+        return Path(self._repo.path)
+
+    @property
+    def workdir(self) -> Optional[Path]:
+        """The root of the working tree, None in a bare repository."""
+        workdir = self._repo.workdir
+        return Path(workdir) if workdir else None
+
+    def get_status(self) -> Dict[str, int]:
+        """The changed and untracked files of the working tree, with their flags."""
+        with self._lock:
+            return self._repo.status()
+
+    @staticmethod
+    def get_commit_id(since: Since) -> pg2.Oid:
+        if isinstance(since, pg2.Oid):
+            return since
+        # annotated tags point to a tag object, not to the commit itself
+        return since.peel(pg2.Commit).id
+
+    def is_ancestor(self, ancestor: pg2.Oid, commit: pg2.Oid) -> bool:
+        return ancestor == commit or self._repo.descendant_of(commit, ancestor)
+
+    def walk(
+        self,
+        head: pg2.Oid,
+        hidden: Iterable[pg2.Oid],
+        sort: SortOrder = SortOrder.TIME,
+        first_parent_only: bool = False,
+    ) -> Iterator[pg2.Commit]:
+        walker = self._repo.walk(head, SORT_MODES[sort])
+        for oid in hidden:
+            walker.hide(oid)
+        if first_parent_only:
+            walker.simplify_first_parent()
+        yield from walker
+
+    def iter_commits(
+        self,
+        since: Since,
+        sort: SortOrder = SortOrder.TIME,
+        first_parent_only: bool = False,
+    ) -> Iterator[pg2.Commit]:
+        """Yield the commits reachable from HEAD but not from since, like
+        git log since..HEAD does.
+        """
+        since_id = self.get_commit_id(since)
+        yield from self.walk(self.head_id, [since_id], sort, first_parent_only)
+
+    def aggregate_shortlog(
+        self,
+        commits: Iterable[pg2.Commit],
+        include_merge_commits: bool,
+        on_progress: Optional[OnProgress] = None,
+    ) -> Shortlog:
+        """on_progress is called with the number of commits walked so far, every
+        PROGRESS_INTERVAL commits and at the end.
+        """
+        shortlog: Shortlog = {}
+        walked = 0
+        with profiling.span("git.walk") as walk_span:
+            for walked, commit in enumerate(commits, start=1):
+                if on_progress is not None and walked % PROGRESS_INTERVAL == 0:
+                    on_progress(walked)
+                if not include_merge_commits and self.is_merge_commit(commit):
+                    continue
+                subject = self.get_subject(commit)
+                shortlog.setdefault(commit.committer.name, []).append(subject)
+            walk_span.set(commits=walked)
+        profiling.count("git.commits_walked", walked)
+        if on_progress is not None:
+            on_progress(walked)
+        return shortlog
+
+    def collect_shortlog(
+        self,
+        since: Since,
+        include_merge_commits: bool,
+        sort: SortOrder = SortOrder.TIME,
+        first_parent_only: bool = False,
+        on_progress: Optional[OnProgress] = None,
+    ) -> Shortlog:
+        commits = self.iter_commits(since, sort, first_parent_only)
+        return self.aggregate_shortlog(commits, include_merge_commits, on_progress)
+
+    def get_shortlog(
+        self,
+        since: Since,
+        include_merge_commits: bool,
+        sort: SortOrder = SortOrder.TIME,
+        first_parent_only: bool = False,
+    ) -> str:
+        shortlog = self.collect_shortlog(
+            since, include_merge_commits, sort, first_parent_only
+        )
+        return format_shortlog(shortlog)
+
+
+def merge_shortlogs(newer: Shortlog, older: Shortlog) -> Shortlog:
+    merged: Shortlog = {name: list(subjects) for name, subjects in newer.items()}
+    for name, subjects in older.items():
+        merged.setdefault(name, []).extend(subjects)
+    return merged
+
+
+def format_shortlog(shortlog: Shortlog) -> str:
+    lines = []
+    for name, subjects in shortlog.items():
+        lines.append(f"{name} ({len(subjects)}):")
+        for subject in subjects:
+            lines.append(f"      {subject}")
+        lines.append("")
+
+    return "\n".join(lines)
@@ -0,0 +1,117 @@
+"""Reader for the commit-graph file git writes with `git commit-graph write`.
+See https://git-scm.com/docs/gitformat-commit-graph
+
+Parents and generation numbers can be read from it without inflating commit
+objects from the pack files. Only a single graph file is supported, not split
+commit-graph chains.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import List, Optional
+
+SIGNATURE = b"CGPH"
+HASH_LENGTHS = {1: 20, 2: 32}
+NO_PARENT = 0x70000000
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+
+
+class CommitGraph:
+    def __init__(self, data: mmap.mmap):
+        self._data = data
+        signature, version, hash_version, num_chunks, num_bases = struct.unpack_from(
+            ">4sBBBB", data
+        )
+        if signature != SIGNATURE or version != 1 or num_bases != 0:
+            raise ValueError("Unsupported commit-graph file")
+        self._hash_length = HASH_LENGTHS[hash_version]
+
+        chunks = {}
+        for i in range(num_chunks):
+            chunk_id, offset = struct.unpack_from(">4sQ", data, 8 + i * 12)
+            chunks[chunk_id] = offset
+        self._fanout = chunks[b"OIDF"]
+        self._oids = chunks[b"OIDL"]
+        self._commit_data = chunks[b"CDAT"]
+        self._extra_edges = chunks.get(b"EDGE")
+        self.num_commits = struct.unpack_from(">I", data, self._fanout + 255 * 4)[0]
+
+    @classmethod
+    def open(cls, git_dir: Path) -> Optional["CommitGraph"]:
+        """The commit-graph of the repository, or None when there is none or it
+        can't be read.
+        """
+        path = git_dir / "objects" / "info" / "commit-graph"
+        try:
+            with path.open("rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            return cls(data)
+        except (struct.error, KeyError, ValueError):
+            data.close()
+            return None
+
+    def close(self):
+        self._data.close()
+
+    def lookup(self, oid: bytes) -> Optional[int]:
+        """Position of the commit in the graph."""
+        first_byte = oid[0]
+        if first_byte == 0:
+            low = 0
+        else:
+            low = struct.unpack_from(
+                ">I", self._data, self._fanout + (first_byte - 1) * 4
+            )[0]
+        high = struct.unpack_from(">I", self._data, self._fanout + first_byte * 4)[0]
+
+        length = self._hash_length
+        while low < high:
+            middle = (low + high) // 2
+            start = self._oids + middle * length
+            current = self._data[start : start + length]
+            if current < oid:
+                low = middle + 1
+            elif current > oid:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def get_oid(self, position: int) -> bytes:
+        start = self._oids + position * self._hash_length
+        return self._data[start : start + self._hash_length]
+
+    def _commit_offset(self, position: int) -> int:
+        return self._commit_data + position * (self._hash_length + 16)
+
+    def get_parents(self, position: int) -> List[int]:
+        offset = self._commit_offset(position) + self._hash_length
+        parent1, parent2 = struct.unpack_from(">II", self._data, offset)
+        if parent1 == NO_PARENT:
+            return []
+        if parent2 == NO_PARENT:
+            return [parent1]
+        if not parent2 & EXTRA_EDGES:
+            return [parent1, parent2]
+
+        # octopus merge, the rest of the parents are in the extra edge list
+        parents = [parent1]
+        edge_offset = self._extra_edges + (parent2 & ~EXTRA_EDGES) * 4
+        while True:
+            edge = struct.unpack_from(">I", self._data, edge_offset)[0]
+            parents.append(edge & ~LAST_EDGE)
+            if edge & LAST_EDGE:
+                return parents
+            edge_offset += 4
+
+    def get_generation(self, position: int) -> int:
+        """Topological level of the commit, 0 if the graph was written without
+        generation numbers.
+        """
+        offset = self._commit_offset(position) + self._hash_length + 8
+        return struct.unpack_from(">I", self._data, offset)[0] >> 2
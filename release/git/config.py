@@ -1,4 +1,5 @@
 import enum
+from typing import Iterator, List, Optional, Union
 
 from pydantic import BaseModel
 
@@ -9,11 +10,46 @@ class SinceWhat(enum.Enum):
     LATEST_MERGE = "LATEST_MERGE"
 
 
+class SortOrder(enum.Enum):
+    TIME = "TIME"
+    TOPOLOGICAL = "TOPOLOGICAL"
+    NONE = "NONE"
+
+
+class MergeRepos(enum.Enum):
+    # one shortlog of every repository
+    COMBINED = "COMBINED"
+    # JSON object of the shortlogs by repository
+    PER_REPO = "PER_REPO"
+
+
 class GetShortlogConfig(BaseModel):
     include_merge_commits: bool
     since: SinceWhat
+    # with LATEST_MERGE: the latest merge from this branch instead of any merge
+    merge_from: Optional[str] = None
+    sort: SortOrder = SortOrder.TIME
+    first_parent_only: bool = False
+    # keep the shortlogs on disk, and only walk the new commits the next time
+    cache: bool = False
+    # defaults to .git/release-py/shortlog
+    cache_dir: Optional[str] = None
 
 
 class GitConfig(BaseModel):
-    repo: str
+    # a path, glob pattern or list of them
+    repo: Union[str, List[str]]
     get_shortlog: GetShortlogConfig
+    # how the shortlogs are put together when there are multiple repositories
+    merge_repos: MergeRepos = MergeRepos.COMBINED
+
+    @property
+    def repos(self) -> List[str]:
+        return [self.repo] if isinstance(self.repo, str) else self.repo
+
+    def iter_templates(self) -> Iterator[str]:
+        yield from self.repos
+        if self.get_shortlog.merge_from:
+            yield self.get_shortlog.merge_from
+        if self.get_shortlog.cache_dir:
+            yield self.get_shortlog.cache_dir
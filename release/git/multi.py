@@ -0,0 +1,103 @@
+"""Shortlogs of many repositories at once. Walking history is CPU-bound, so the
+repositories are walked in worker processes instead of threads.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cache import Counts, add_worker_counts, get_shortlog_cache
+from .client import OnProgress, Shortlog
+from .config import GetShortlogConfig
+from .pool import get_repo
+
+# shortlog, hits, misses and extended shortlogs of the cache, commits walked,
+# seconds
+RepoResult = Tuple[Shortlog, Counts, int, float]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _collect_in_worker(
+    repo_path: Path,
+    conf: GetShortlogConfig,
+    merge_from: Optional[str],
+    cache_dir: Optional[Path],
+) -> RepoResult:
+    from .run import collect_shortlog
+
+    start = time.perf_counter()
+    walked = 0
+
+    def on_progress(commits: int):
+        nonlocal walked
+        walked = commits
+
+    try:
+        cache = conf.cache and get_shortlog_cache(get_repo(repo_path), cache_dir)
+        before = cache.counts if cache else (0, 0, 0)
+        shortlog = collect_shortlog(repo_path, conf, merge_from, cache_dir, on_progress)
+    except Exception as e:
+        raise ValueError(f"{repo_path}: {e}") from None
+    after = cache.counts if cache else (0, 0, 0)
+    counts = tuple(a - b for a, b in zip(after, before))
+    return shortlog, counts, walked, time.perf_counter() - start
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """Workers are kept for the whole process, so every repository is opened and
+    indexed only once per worker, like with get_repo.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(os.cpu_count(), mp_context=context)
+        return _pool
+
+
+@atexit.register
+def _shutdown_worker_pool():
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+
+
+def collect_shortlogs(
+    repo_paths: List[Path],
+    conf: GetShortlogConfig,
+    merge_from: Optional[str],
+    cache_dir: Optional[Path],
+    echo: Callable[[str], None],
+    on_progress: Optional[OnProgress] = None,
+) -> Dict[Path, Shortlog]:
+    """Shortlog of every repository, walked in parallel. on_progress is called
+    with the total number of commits walked whenever a repository is finished.
+    """
+    pool = get_worker_pool()
+    futures = {
+        pool.submit(_collect_in_worker, path, conf, merge_from, cache_dir): path
+        for path in repo_paths
+    }
+    shortlogs = {}
+    total_walked = 0
+    try:
+        for future in as_completed(futures):
+            path = futures[future]
+            shortlog, counts, walked, seconds = future.result()
+            add_worker_counts(counts)
+            echo(f"{path}: {walked} commits in {seconds * 1000:.0f} ms")
+            shortlogs[path] = shortlog
+            total_walked += walked
+            if on_progress is not None:
+                on_progress(total_walked)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return shortlogs
@@ -0,0 +1,31 @@
+import atexit
+import threading
+from pathlib import Path
+from typing import Dict
+
+from .client import Repo
+
+_repos: Dict[Path, Repo] = {}
+_lock = threading.Lock()
+
+
+def get_repo(path: Path) -> Repo:
+    """Open every repository only once in the process, so steps share the opened
+    pygit2.Repository and everything cached on the Repo (tag index, commit-graph).
+    The pool outlives TUI restarts, because only the tui module is reloaded.
+    """
+    key = path.resolve()
+    with _lock:
+        repo = _repos.get(key)
+        if repo is None:
+            repo = _repos[key] = Repo(key)
+        return repo
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        repos = list(_repos.values())
+        _repos.clear()
+    for repo in repos:
+        repo.close()
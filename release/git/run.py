@@ -1,21 +1,145 @@
+import glob
+import hashlib
+import json
+import os
 from pathlib import Path
+from typing import Callable, List, Optional
+
+import pygit2 as pg2
 
 from ..parser import render_text
 from ..types import Variables
-from .client import Repo
-from .config import GitConfig, SinceWhat
-
-
-def run_step(git_config: GitConfig, variables: Variables) -> str:
-    repo_path = render_text(git_config.repo, variables)
-    repo_path = Path(repo_path)
-    repo = Repo(repo_path)
-    if git_config.get_shortlog:
-        conf = git_config.get_shortlog
-        if conf.since is SinceWhat.LATEST_TAG:
-            since = repo.get_latest_tag()
-        elif conf.since is SinceWhat.LATEST_ANNOTATED_TAG:
-            since = repo.get_latest_annotated_tag()
-        print("Getting shortlog")
-        return repo.get_shortlog(since, conf.include_merge_commits)
-    raise ValueError("Invalid git config")
+from .cache import get_shortlog_cache
+from .client import OnProgress, Repo, Shortlog, format_shortlog, merge_shortlogs
+from .config import GetShortlogConfig, GitConfig, MergeRepos, SinceWhat
+from .pool import get_repo
+from .tags import get_signature
+
+Echo = Callable[[str], None]
+
+
+def get_repo_paths(git_config: GitConfig, variables: Variables) -> List[Path]:
+    """The repositories of the step, with glob patterns expanded to the matching
+    directories in sorted order. Raises ValueError when a pattern matches none.
+    """
+    paths = []
+    for repo in git_config.repos:
+        pattern = render_text(repo, variables)
+        if glob.has_magic(pattern):
+            matches = sorted(Path(p) for p in glob.glob(pattern))
+            matches = [p for p in matches if p.is_dir()]
+            if not matches:
+                raise ValueError(f"No repositories match {pattern!r}")
+            paths.extend(matches)
+        else:
+            paths.append(Path(pattern))
+    return paths
+
+
+def collect_shortlog(
+    repo_path: Path,
+    conf: GetShortlogConfig,
+    merge_from: Optional[str],
+    cache_dir: Optional[Path],
+    on_progress: Optional[OnProgress] = None,
+) -> Shortlog:
+    repo = get_repo(repo_path)
+    if conf.since is SinceWhat.LATEST_TAG:
+        since = repo.get_latest_tag()
+    elif conf.since is SinceWhat.LATEST_ANNOTATED_TAG:
+        since = repo.get_latest_annotated_tag()
+    elif conf.since is SinceWhat.LATEST_MERGE:
+        since = repo.find_latest_merge(merge_from)
+    if conf.cache:
+        cache = get_shortlog_cache(repo, cache_dir)
+        return cache.collect(repo, since, conf, on_progress)
+    return repo.collect_shortlog(
+        since,
+        conf.include_merge_commits,
+        conf.sort,
+        conf.first_parent_only,
+        on_progress,
+    )
+
+
+def run_step(
+    git_config: GitConfig,
+    variables: Variables,
+    echo: Echo = print,
+    on_progress: Optional[OnProgress] = None,
+) -> str:
+    if not git_config.get_shortlog:
+        raise ValueError("Invalid git config")
+    conf = git_config.get_shortlog
+    merge_from = conf.merge_from and render_text(conf.merge_from, variables)
+    cache_dir = conf.cache_dir and Path(render_text(conf.cache_dir, variables))
+
+    repo_paths = get_repo_paths(git_config, variables)
+    if isinstance(git_config.repo, str) and len(repo_paths) == 1:
+        echo("Getting shortlog")
+        shortlog = collect_shortlog(
+            repo_paths[0], conf, merge_from, cache_dir, on_progress
+        )
+        return format_shortlog(shortlog)
+
+    # imported here, so single repository steps don't start worker processes
+    from .multi import collect_shortlogs
+
+    echo(f"Getting shortlog of {len(repo_paths)} repositories")
+    shortlogs = collect_shortlogs(
+        repo_paths, conf, merge_from, cache_dir, echo, on_progress
+    )
+    if git_config.merge_repos is MergeRepos.PER_REPO:
+        return json.dumps({str(path): shortlogs[path] for path in repo_paths})
+    combined: Shortlog = {}
+    for path in repo_paths:
+        combined = merge_shortlogs(combined, shortlogs[path])
+    return format_shortlog(combined)
+
+
+def _find_repo(path: Path) -> Optional[Repo]:
+    """The pooled Repo of the repository containing path, None when path is not
+    in a repository. It's opened by its worktree root, like the steps open it,
+    so they share one Repo.
+    """
+    git_dir = pg2.discover_repository(str(path))
+    if git_dir is None:
+        return None
+    git_dir = Path(git_dir)
+    root = git_dir.parent if git_dir.name == ".git" else git_dir
+    return get_repo(root)
+
+
+def get_repo_state(path: Path) -> Optional[str]:
+    """HEAD and the state of the tags of the repository containing path, which
+    changes when a new commit or tag is made. None when path is not in a repository.
+    """
+    repo = _find_repo(path)
+    if repo is None:
+        return None
+    try:
+        head_id = repo.head_id
+    except pg2.GitError:
+        # no commits yet
+        return None
+    return f"{head_id}-{get_signature(repo.git_dir)}"
+
+
+def get_worktree_state(path: Path) -> Optional[str]:
+    """Hash of the uncommitted changes in the working tree of the repository
+    containing path: the changed and untracked files with their size and mtime.
+    None when path is not in a repository with a working tree.
+    """
+    repo = _find_repo(path)
+    if repo is None or repo.workdir is None:
+        return None
+    digest = hashlib.sha256()
+    for file_path, flags in sorted(repo.get_status().items()):
+        try:
+            stat = os.stat(repo.workdir / file_path)
+            file_state = f"{stat.st_size}-{stat.st_mtime_ns}"
+        except OSError:
+            # deleted
+            file_state = ""
+        digest.update(f"{file_path}:{flags}:{file_state}\n".encode())
+    return digest.hexdigest()
@@ -0,0 +1,103 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pygit2 as pg2
+from pygit2.enums import ReferenceFilter
+
+# modification times of packed-refs and of the directories under refs/tags
+Signature = Tuple[Optional[int], Tuple[Tuple[str, int], ...]]
+
+
+def get_common_dir(git_dir: Path) -> Path:
+    """The directory shared by the worktrees of a repository, which has the
+    references of the tags.
+    """
+    try:
+        common_dir = (git_dir / "commondir").read_text().strip()
+    except FileNotFoundError:
+        return git_dir
+    return (git_dir / common_dir).resolve()
+
+
+def get_signature(git_dir: Path) -> Signature:
+    """Modification times of the files where tags are stored. Creating, moving
+    or deleting a tag, also one in a subdirectory like refs/tags/release/1.0,
+    changes at least one of them.
+    """
+    common_dir = get_common_dir(git_dir)
+    tags_dir = common_dir / "refs" / "tags"
+    directories = []
+    for dirpath, dirnames, _ in os.walk(tags_dir):
+        dirnames.sort()
+        mtime = _mtime(Path(dirpath))
+        if mtime is not None:
+            directories.append((os.path.relpath(dirpath, tags_dir), mtime))
+    return _mtime(common_dir / "packed-refs"), tuple(directories)
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def version_key(tag_name: str) -> list:
+    """Sort key which orders the numbers in tag names by value, v1.10 after v1.9."""
+    return [
+        (0, int(part)) if part.isdigit() else (1, part)
+        for part in re.split(r"(\d+)", tag_name)
+    ]
+
+
+class TagIndex:
+    """Tag names by the commit id they point to (after peeling annotated tags),
+    with annotated and lightweight tags kept separately.
+    """
+
+    def __init__(self, repo: pg2.Repository):
+        self.annotated: Dict[pg2.Oid, List[str]] = {}
+        self.lightweight: Dict[pg2.Oid, List[str]] = {}
+        # tagger time of the annotated tags
+        self.tag_times: Dict[str, int] = {}
+
+        for ref in repo.references.iterator(ReferenceFilter.TAGS):
+            tag_name = ref.name.removeprefix("refs/tags/")
+            obj = repo[ref.target]
+            if isinstance(obj, pg2.Tag):
+                tags = self.annotated
+                if obj.tagger is not None:
+                    self.tag_times[tag_name] = obj.tagger.time
+            else:
+                tags = self.lightweight
+            try:
+                commit_id = obj.peel(pg2.Commit).id
+            except pg2.GitError:
+                # tags of trees or blobs are not part of the history
+                continue
+            tags.setdefault(commit_id, []).append(tag_name)
+
+    def find_latest(
+        self, repo: pg2.Repository, head: pg2.Oid, annotated_only: bool
+    ) -> Optional[str]:
+        """Name of the newest tag reachable from head. Like git describe, prefers
+        annotated tags when a commit has both kinds. Of the tags of one commit,
+        the latest tagged one wins, then the highest version.
+        """
+        if not self.annotated and (annotated_only or not self.lightweight):
+            return None
+
+        # time sorting is incremental, topological sorting would walk everything
+        for commit in repo.walk(head, pg2.GIT_SORT_TIME):
+            tag_names = self.annotated.get(commit.id)
+            if not tag_names and not annotated_only:
+                tag_names = self.lightweight.get(commit.id)
+            if tag_names:
+                return max(
+                    tag_names,
+                    key=lambda name: (self.tag_times.get(name, 0), version_key(name)),
+                )
+
+        return None
@@ -0,0 +1,12 @@
+from .config import GitlabConfig as GitlabConfig
+
+
+def __getattr__(name: str):
+    # the HTTP client is only imported when a gitlab step actually runs
+    if name in ("run_step", "GitlabError"):
+        from .client import GitlabError
+        from .run import run_step
+
+        globals().update(run_step=run_step, GitlabError=GitlabError)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
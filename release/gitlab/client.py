@@ -0,0 +1,296 @@
+import atexit
+import hashlib
+import http.client
+import json
+import queue
+import random
+import re
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from .. import profiling
+from ..cache import DiskCache, get_cache_dir
+
+# seconds to wait for the server before a request is retried
+TIMEOUT = 30
+PER_PAGE = 100
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# statuses of requests which can be sent again, the server didn't process them
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+# the server closed an idle keep-alive connection before the request arrived
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+_LINK_NEXT_RE = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+Body = Union[bytes, Path, None]
+
+
+class GitlabError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Response:
+    status: int
+    # with lowercase names
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+def get_backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retrying, Retry-After of the server when it's sent."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    delay = min(BACKOFF_BASE * 2**attempt, BACKOFF_MAX)
+    # jitter, so concurrent requests don't retry at the same moment
+    return delay * random.uniform(0.5, 1)
+
+
+def get_error_message(response: Response) -> str:
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        message = data.get("message") or data.get("error")
+        if message:
+            return message if isinstance(message, str) else json.dumps(message)
+    return http.client.responses.get(response.status, "")
+
+
+class Session:
+    """Keep-alive connections to the API of a GitLab instance, shared by the
+    threads of a release. At most pool_size requests are sent at once.
+    Responses of GET requests with an ETag are cached on disk, and sent again
+    with If-None-Match, so polling unchanged resources is cheap.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: Optional[str],
+        pool_size: int = 8,
+        retries: int = 3,
+        cache: Optional[DiskCache] = None,
+    ):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https"):
+            raise ValueError(f"Invalid GitLab URL: {url!r}")
+        self._connection_class = (
+            http.client.HTTPSConnection
+            if parsed.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self._host = parsed.netloc
+        self.api_path = parsed.path.rstrip("/") + "/api/v4"
+        self.api_url = f"{parsed.scheme}://{parsed.netloc}{self.api_path}"
+        self.retries = retries
+        self._token = token
+        self._cache = cache
+        # the token is part of the cache keys, so users don't see each others data
+        token_hash = hashlib.sha256((token or "").encode()).hexdigest()
+        self._cache_prefix = f"{token_hash[:16]}:{url}"
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _get_connection(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """An idle connection, or a new one. True when it was used before."""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connection_class(self._host, timeout=TIMEOUT), False
+
+    def _send(
+        self, method: str, path: str, headers: Dict[str, str], body: Body
+    ) -> Response:
+        with self._slots:
+            connection, reused = self._get_connection()
+            while True:
+                try:
+                    response = self._send_on(connection, method, path, headers, body)
+                except STALE_CONNECTION_ERRORS:
+                    connection.close()
+                    if not reused:
+                        raise
+                    connection, reused = self._get_connection()
+                    continue
+                except BaseException:
+                    connection.close()
+                    raise
+                break
+            self._idle.put(connection)
+            return response
+
+    def _send_on(
+        self,
+        connection: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        headers: Dict[str, str],
+        body: Body,
+    ) -> Response:
+        if isinstance(body, Path):
+            # streamed from the file, without reading it into memory
+            headers = {**headers, "Content-Length": str(body.stat().st_size)}
+            with body.open("rb") as f:
+                connection.request(method, path, body=f, headers=headers)
+        else:
+            connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            connection.close()
+        headers = {name.lower(): value for name, value in response.getheaders()}
+        return Response(response.status, headers, data)
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        headers: Dict[str, str],
+        body: Body = None,
+    ) -> Response:
+        """Send the request, and retry it when it failed before the server could
+        process it.
+        """
+        attempt = 0
+        while True:
+            with profiling.span("gitlab.request", method=method, path=path) as span:
+                try:
+                    response = self._send(method, path, headers, body)
+                except (OSError, http.client.HTTPException) as e:
+                    if attempt >= self.retries or method not in IDEMPOTENT_METHODS:
+                        raise GitlabError(f"{method} {path}: {e}") from e
+                    delay = get_backoff(attempt)
+                else:
+                    span.set(status=response.status)
+                    retryable = response.status in RETRY_STATUSES and (
+                        method in IDEMPOTENT_METHODS or response.status in (429, 503)
+                    )
+                    if not retryable or attempt >= self.retries:
+                        return response
+                    delay = get_backoff(attempt, response.headers.get("retry-after"))
+            profiling.count("gitlab.retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Any = None,
+        body: Body = None,
+    ) -> Response:
+        """Request to the API, path is relative to /api/v4, or a full path with
+        query string. Raises GitlabError for error statuses.
+        """
+        if not path.startswith(self.api_path + "/"):
+            path = self.api_path + path
+        if params:
+            path += "?" + urllib.parse.urlencode(params)
+        headers = {"Accept": "application/json", "User-Agent": "release-py"}
+        if self._token:
+            headers["PRIVATE-TOKEN"] = self._token
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+
+        cache_key = None
+        cached = None
+        if method == "GET" and self._cache is not None:
+            key_source = f"{self._cache_prefix}{path}".encode()
+            cache_key = hashlib.sha256(key_source).hexdigest()
+            cached = self._cache.load(cache_key)
+            if cached is not None:
+                headers["If-None-Match"] = cached["etag"]
+
+        response = self._request(method, path, headers, body)
+        profiling.count("gitlab.requests")
+        if response.status == 304 and cached is not None:
+            profiling.count("gitlab.not_modified")
+            return Response(200, cached["headers"], cached["body"].encode())
+        if response.status >= 400:
+            message = get_error_message(response)
+            raise GitlabError(
+                f"{method} {path}: {response.status} {message}", response.status
+            )
+        etag = response.headers.get("etag")
+        if cache_key is not None and etag and response.status == 200:
+            headers = {
+                name: value
+                for name, value in response.headers.items()
+                if name in ("link", "x-next-page", "x-total")
+            }
+            entry = {"etag": etag, "headers": headers, "body": response.body.decode()}
+            self._cache.put(cache_key, entry)
+        return response
+
+    def get(self, path: str, **params: Any) -> Any:
+        return self.request("GET", path, params).json()
+
+    def post(self, path: str, json_body: Any) -> Any:
+        return self.request("POST", path, json_body=json_body).json()
+
+    def put(self, path: str, json_body: Any) -> Any:
+        return self.request("PUT", path, json_body=json_body).json()
+
+    def paginate(self, path: str, **params: Any) -> Iterator[Any]:
+        """Items of every page, yielded as each page arrives, so callers looking
+        for one item can stop before the remaining pages are requested.
+        """
+        response = self.request("GET", path, {"per_page": PER_PAGE, **params})
+        while True:
+            yield from response.json()
+            match = _LINK_NEXT_RE.search(response.headers.get("link", ""))
+            if not match:
+                return
+            next_url = urllib.parse.urlsplit(match.group(1))
+            response = self.request("GET", f"{next_url.path}?{next_url.query}")
+
+
+_sessions: Dict[Tuple[str, Optional[str], int, int], Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(
+    url: str, token: Optional[str], pool_size: int, retries: int
+) -> Session:
+    """The session of the instance, created once and shared by every step."""
+    key = (url, token, pool_size, retries)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            cache = DiskCache(get_cache_dir("gitlab"))
+            session = _sessions[key] = Session(url, token, pool_size, retries, cache)
+        return session
+
+
+@atexit.register
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,107 @@
+from typing import Iterator, List, Optional, Union
+
+from pydantic import BaseModel, root_validator
+
+# fields of GitlabConfig which are operations, one of them has to be specified
+OPERATIONS = ("release", "merge_request", "tag", "pipeline")
+
+
+class AssetConfig(BaseModel):
+    name: str
+    # a link to an existing file, or path of a file uploaded to the package registry
+    url: Optional[str] = None
+    path: Optional[str] = None
+
+    @root_validator(pre=True)
+    def validate_url_or_path(cls, values):
+        if ("url" in values) == ("path" in values):
+            raise ValueError("Exactly one of 'url' and 'path' is required")
+        return values
+
+
+class ReleaseOperation(BaseModel):
+    tag_name: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    # branch or commit the tag is created from, when it doesn't exist yet
+    ref: Optional[str] = None
+    assets: List[AssetConfig] = []
+
+
+class MergeRequestOperation(BaseModel):
+    source_branch: str
+    target_branch: str
+    title: str
+    description: Optional[str] = None
+
+
+class TagOperation(BaseModel):
+    name: str
+    ref: str
+    # makes an annotated tag
+    message: Optional[str] = None
+
+
+class PipelineOperation(BaseModel):
+    ref: str
+    # seconds to wait for the latest pipeline of the ref to finish
+    timeout: float = 3600
+    interval: float = 10
+
+
+class GitlabConfig(BaseModel):
+    # base URL of the instance, a local server can be used for testing
+    url: str = "https://gitlab.com"
+    # environment variable with the access token
+    token_env: str = "GITLAB_TOKEN"
+    # path or id of a project, or list of them
+    project: Union[str, List[str]]
+    # number of requests sent at once
+    concurrency: int = 8
+    # times a failed request is retried, waiting longer every time
+    retries: int = 3
+
+    release: Optional[ReleaseOperation] = None
+    merge_request: Optional[MergeRequestOperation] = None
+    tag: Optional[TagOperation] = None
+    pipeline: Optional[PipelineOperation] = None
+
+    @root_validator(pre=True)
+    def validate_one_operation(cls, values):
+        operations = [op for op in OPERATIONS if op in values]
+        if len(operations) != 1:
+            raise ValueError(f"Exactly one of {OPERATIONS!r} is required")
+        return values
+
+    @property
+    def projects(self) -> List[str]:
+        return [self.project] if isinstance(self.project, str) else self.project
+
+    @property
+    def operation(self) -> str:
+        return next(op for op in OPERATIONS if getattr(self, op) is not None)
+
+    def iter_templates(self) -> Iterator[str]:
+        yield self.url
+        yield from self.projects
+        if self.release:
+            yield self.release.tag_name
+            for text in (self.release.name, self.release.description, self.release.ref):
+                if text:
+                    yield text
+            for asset in self.release.assets:
+                yield asset.name
+                yield asset.url or asset.path
+        elif self.merge_request:
+            yield self.merge_request.source_branch
+            yield self.merge_request.target_branch
+            yield self.merge_request.title
+            if self.merge_request.description:
+                yield self.merge_request.description
+        elif self.tag:
+            yield self.tag.name
+            yield self.tag.ref
+            if self.tag.message:
+                yield self.tag.message
+        elif self.pipeline:
+            yield self.pipeline.ref
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ..parser import render_text
+from ..types import Variables
+from .client import GitlabError, Session, get_session
+from .config import (
+    GitlabConfig,
+    MergeRequestOperation,
+    PipelineOperation,
+    ReleaseOperation,
+    TagOperation,
+)
+
+Echo = Callable[[str], None]
+
+# name of the generic package the files of release assets are uploaded to
+ASSETS_PACKAGE = "release-assets"
+PIPELINE_FINISHED = {"success", "failed", "canceled", "skipped", "manual"}
+PIPELINE_FAILED = {"failed", "canceled"}
+
+
+def render(text: Optional[str], variables: Variables) -> Optional[str]:
+    return text and render_text(text, variables)
+
+
+def get_project_path(project: str) -> str:
+    return "/projects/" + urllib.parse.quote(project, safe="")
+
+
+def upload_asset(
+    session: Session, project: str, tag_name: str, name: str, path: Path
+) -> Dict[str, str]:
+    """Upload the file to the package registry, and return the release link to it."""
+    package_path = (
+        f"{get_project_path(project)}/packages/generic/{ASSETS_PACKAGE}/"
+        f"{urllib.parse.quote(tag_name, safe='')}/{urllib.parse.quote(path.name)}"
+    )
+    session.request("PUT", package_path, body=path)
+    return {"name": name, "url": session.api_url + package_path}
+
+
+def create_release(
+    session: Session,
+    project: str,
+    op: ReleaseOperation,
+    variables: Variables,
+    echo: Echo,
+    stop: threading.Event,
+) -> str:
+    """Create the release, or update the notes of an existing one. Returns its URL."""
+    tag_name = render_text(op.tag_name, variables)
+    links = []
+    uploads = []
+    for asset in op.assets:
+        name = render_text(asset.name, variables)
+        if asset.path:
+            uploads.append((name, Path(render_text(asset.path, variables))))
+        else:
+            links.append({"name": name, "url": render_text(asset.url, variables)})
+    if uploads:
+        # sent at once, as many as the session allows
+        echo(f"{project}: uploading {len(uploads)} assets")
+        with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+            links += executor.map(
+                lambda upload: upload_asset(session, project, tag_name, *upload),
+                uploads,
+            )
+
+    release = {
+        "tag_name": tag_name,
+        "name": render(op.name, variables) or tag_name,
+        "description": render(op.description, variables),
+    }
+    releases_path = f"{get_project_path(project)}/releases"
+    try:
+        data = session.post(
+            releases_path,
+            {**release, "ref": render(op.ref, variables), "assets": {"links": links}},
+        )
+    except GitlabError as e:
+        if e.status != 409:
+            raise
+        echo(f"{project}: release {tag_name} exists, updating it")
+        release_path = f"{releases_path}/{urllib.parse.quote(tag_name, safe='')}"
+        data = session.put(release_path, release)
+        for link in links:
+            session.post(f"{release_path}/assets/links", link)
+    else:
+        echo(f"{project}: created release {tag_name}")
+    return data["_links"]["self"]
+
+
+def create_merge_request(
+    session: Session,
+    project: str,
+    op: MergeRequestOperation,
+    variables: Variables,
+    echo: Echo,
+    stop: threading.Event,
+) -> str:
+    """Open the merge request, unless one is already open. Returns its URL."""
+    source_branch = render_text(op.source_branch, variables)
+    target_branch = render_text(op.target_branch, variables)
+    merge_requests_path = f"{get_project_path(project)}/merge_requests"
+    opened = session.paginate(
+        merge_requests_path,
+        state="opened",
+        source_branch=source_branch,
+        target_branch=target_branch,
+    )
+    existing = next(opened, None)
+    if existing is not None:
+        echo(f"{project}: merge request is already open")
+        return existing["web_url"]
+
+    data = session.post(
+        merge_requests_path,
+        {
+            "source_branch": source_branch,
+            "target_branch": target_branch,
+            "title": render_text(op.title, variables),
+            "description": render(op.description, variables),
+        },
+    )
+    echo(f"{project}: opened merge request !{data['iid']}")
+    return data["web_url"]
+
+
+def create_tag(
+    session: Session,
+    project: str,
+    op: TagOperation,
+    variables: Variables,
+    echo: Echo,
+    stop: threading.Event,
+) -> str:
+    """Returns the id of the tagged commit."""
+    name = render_text(op.name, variables)
+    data = session.post(
+        f"{get_project_path(project)}/repository/tags",
+        {
+            "tag_name": name,
+            "ref": render_text(op.ref, variables),
+            "message": render(op.message, variables),
+        },
+    )
+    echo(f"{project}: created tag {name}")
+    return data["commit"]["id"]
+
+
+def wait_for_pipeline(
+    session: Session,
+    project: str,
+    op: PipelineOperation,
+    variables: Variables,
+    echo: Echo,
+    stop: threading.Event,
+) -> str:
+    """Wait for the latest pipeline of the ref to finish, and return its status.
+    Raises GitlabError when it failed, was canceled or doesn't finish in time.
+    """
+    ref = render_text(op.ref, variables)
+    deadline = time.monotonic() + op.timeout
+    last_status = None
+    while True:
+        pipelines = session.get(
+            f"{get_project_path(project)}/pipelines",
+            ref=ref,
+            order_by="id",
+            sort="desc",
+            per_page=1,
+        )
+        pipeline = pipelines[0] if pipelines else None
+        status = pipeline["status"] if pipeline else "not started"
+        if status != last_status:
+            echo(f"{project}: pipeline of {ref} is {status}")
+            last_status = status
+        if status in PIPELINE_FAILED:
+            raise GitlabError(f"{project}: pipeline {status}: {pipeline['web_url']}")
+        if status in PIPELINE_FINISHED:
+            return status
+        if time.monotonic() >= deadline:
+            raise GitlabError(f"{project}: pipeline of {ref} didn't finish in time")
+        if stop.wait(op.interval):
+            raise GitlabError(f"{project}: stopped waiting for the pipeline")
+
+
+OPERATIONS = {
+    "release": create_release,
+    "merge_request": create_merge_request,
+    "tag": create_tag,
+    "pipeline": wait_for_pipeline,
+}
+
+
+def run_step(
+    gitlab_config: GitlabConfig, variables: Variables, echo: Echo = print
+) -> str:
+    """Run the operation on every project at once. The output is the output of the
+    operation with a single project, and a JSON object by project with a list.
+    """
+    url = render_text(gitlab_config.url, variables).rstrip("/")
+    token = os.environ.get(gitlab_config.token_env)
+    session = get_session(url, token, gitlab_config.concurrency, gitlab_config.retries)
+    name = gitlab_config.operation
+    operation = OPERATIONS[name]
+    op = getattr(gitlab_config, name)
+    projects: List[str] = [
+        render_text(project, variables) for project in gitlab_config.projects
+    ]
+
+    if isinstance(gitlab_config.project, str):
+        return operation(session, projects[0], op, variables, echo, threading.Event())
+
+    outputs = {}
+    # tells the pipelines still polling to stop when one of the projects failed
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=gitlab_config.concurrency) as executor:
+        futures = {
+            executor.submit(
+                operation, session, project, op, variables, echo, stop
+            ): project
+            for project in projects
+        }
+        try:
+            for future in as_completed(futures):
+                outputs[futures[future]] = future.result()
+        except BaseException:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+    return json.dumps({project: outputs[project] for project in projects})
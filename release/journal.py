@@ -0,0 +1,177 @@
+"""Append-only record of a release run, so an interrupted run can be resumed
+without running the finished steps again.
+
+Every line is a JSON object, flushed and fsync'd before the run continues:
+    {"event": "begin", "variables": {...}}
+    {"event": "start", "step": 3, "fingerprint": "..."}
+    {"event": "finish", "step": 3, "fingerprint": "...", "variable": "X", "output": "..."}
+    {"event": "end"}
+Outputs larger than INLINE_MAX_SIZE are stored in a separate file named by their
+hash, and the finish record has an "output_ref" instead of the output.
+A run which finished every step ends with an "end" record, and is not resumed. Large
+outputs are replayed as FileValue, reading the file only when it's used.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import Step
+from .scheduler import get_dependencies
+from .types import Variables
+from .values import FILE_VALUE_MIN_SIZE, FileValue, Value, get_digest
+
+INLINE_MAX_SIZE = 4096
+
+
+def get_journal_path(release_file: Path) -> Path:
+    return release_file.with_name(f".{release_file.name}.journal")
+
+
+def get_fingerprint(step: Step) -> str:
+    """Changes when the step is edited, so its recorded output is not reused."""
+    return hashlib.sha256(step.json().encode()).hexdigest()
+
+
+@dataclass
+class FinishedStep:
+    fingerprint: str
+    variable: Optional[str]
+    output: Value
+
+
+@dataclass
+class JournalState:
+    # the initial variables of the run, None when the journal is empty
+    variables: Optional[Variables] = None
+    finished: Dict[int, FinishedStep] = field(default_factory=dict)
+
+    def get_completed(self, steps: List[Step]) -> Dict[int, Value]:
+        """Outputs of the steps which don't need to run again: they finished
+        unchanged, and so did every step they depend on.
+        """
+        completed = {}
+        for i, dependencies in enumerate(get_dependencies(steps)):
+            finished = self.finished.get(i)
+            if finished is None or finished.fingerprint != get_fingerprint(steps[i]):
+                continue
+            if dependencies <= completed.keys():
+                completed[i] = finished.output
+        return completed
+
+
+class Journal:
+    def __init__(self, path: Path):
+        self.path = path
+        self.outputs_dir = path.with_name(f"{path.name}.d")
+        self._file = None
+
+    def begin(self, variables: Variables):
+        """Start a new run, discarding the previous one."""
+        self.close()
+        for output_path in self.outputs_dir.glob("*"):
+            output_path.unlink()
+        self._file = self.path.open("w", encoding="utf-8")
+        self._write({"event": "begin", "variables": variables})
+
+    def start(self, step_index: int, step: Step):
+        self._write(
+            {"event": "start", "step": step_index, "fingerprint": get_fingerprint(step)}
+        )
+
+    def finish(self, step_index: int, step: Step, output: Value):
+        record = {
+            "event": "finish",
+            "step": step_index,
+            "fingerprint": get_fingerprint(step),
+            "variable": step.set_variable,
+        }
+        if isinstance(output, FileValue) or len(output) > INLINE_MAX_SIZE:
+            record["output_ref"] = self._store_output(output)
+        else:
+            record["output"] = output
+        self._write(record)
+
+    def complete(self):
+        """Mark the run finished, so it's not resumed."""
+        self._write({"event": "end"})
+
+    def replay(self) -> JournalState:
+        state = JournalState()
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return state
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line can be partially written when the process died
+                break
+            if record["event"] == "begin":
+                state = JournalState(record["variables"])
+            elif record["event"] == "end":
+                state = JournalState()
+            elif record["event"] == "finish":
+                try:
+                    output = self._get_output(record)
+                except OSError:
+                    # the output file is gone, the step has to run again
+                    continue
+                state.finished[record["step"]] = FinishedStep(
+                    record["fingerprint"], record["variable"], output
+                )
+        return state
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        # cut off a partially written last line, so the next record starts on
+        # its own line
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        if data and not data.endswith(b"\n"):
+            with self.path.open("r+b") as f:
+                f.truncate(data.rfind(b"\n") + 1)
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def _write(self, record: dict):
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _store_output(self, output: Value) -> str:
+        ref = get_digest(output)
+        path = self.outputs_dir / ref
+        if not path.exists():
+            self.outputs_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.outputs_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(output, FileValue):
+                    output.copy_to(f)
+                else:
+                    f.write(output.encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return ref
+
+    def _get_output(self, record: dict) -> Value:
+        if "output_ref" not in record:
+            return record["output"]
+        path = self.outputs_dir / record["output_ref"]
+        if path.stat().st_size > FILE_VALUE_MIN_SIZE:
+            # the journal keeps the file until the next run begins
+            return FileValue(path, owned=False)
+        return path.read_text(encoding="utf-8")
@@ -0,0 +1,144 @@
+"""Run the same release file for many variable sets or project directories.
+Every instance is a separate `release start --non-interactive` process, so the
+variables, the working directory and the output of the instances are isolated.
+"""
+
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+import yaml
+from pydantic import BaseModel
+
+from .config import YamlLoader
+from .types import Variables
+
+
+class MatrixInstance(BaseModel):
+    name: Optional[str] = None
+    # working directory of the instance, the current directory by default
+    dir: Optional[Path] = None
+    variables: Dict[str, str] = {}
+
+
+@dataclass
+class InstanceResult:
+    name: str
+    returncode: int
+    seconds: float
+    log_path: Path
+
+
+def load_matrix_file(path: Path) -> List[MatrixInstance]:
+    """A list of instances, or of variable sets as a shorthand for instances
+    with only variables. Relative directories are resolved from the directory of
+    the matrix file, and raise ValueError when they don't exist.
+    """
+    entries = yaml.load(path.read_text(), Loader=YamlLoader)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: the matrix has to be a list")
+    instances = []
+    for number, entry in enumerate(entries, start=1):
+        if isinstance(entry, dict) and not entry.keys() & {"name", "dir", "variables"}:
+            entry = {"variables": entry}
+        instance = MatrixInstance.parse_obj(entry)
+        if instance.dir is not None:
+            instance.dir = (path.parent / instance.dir).resolve()
+            if not instance.dir.is_dir():
+                raise ValueError(
+                    f"{path}: directory of instance {number} doesn't exist: "
+                    f"{instance.dir}"
+                )
+        instances.append(instance)
+    return instances
+
+
+def assign_names(instances: List[MatrixInstance]) -> List[str]:
+    """Unique names of the instances which can be used in file names."""
+    names = []
+    for number, instance in enumerate(instances, start=1):
+        name = instance.name or (instance.dir and instance.dir.name) or str(number)
+        name = re.sub(r"[^\w.-]", "_", name)
+        if name in names:
+            name = f"{name}-{number}"
+        names.append(name)
+    return names
+
+
+def get_command(release_file: Path, journal_path: Path, variables: Variables):
+    command = [sys.executable, "-m", "release", "-f", str(release_file)]
+    command += ["start", "--non-interactive", "--journal", str(journal_path)]
+    for name, value in variables.items():
+        command += ["--var", f"{name}={value}"]
+    return command
+
+
+def run_instance(
+    name: str, instance: MatrixInstance, release_file: Path, log_dir: Path
+) -> InstanceResult:
+    log_path = log_dir / f"{name}.log"
+    command = get_command(release_file, log_dir / f"{name}.journal", instance.variables)
+    start = time.perf_counter()
+    with log_path.open("wb") as log:
+        try:
+            process = subprocess.run(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                cwd=instance.dir,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            # e.g. the directory was removed, the other instances still run
+            log.write(f"Couldn't start the instance: {e}\n".encode())
+            returncode = -1
+        else:
+            returncode = process.returncode
+    return InstanceResult(name, returncode, time.perf_counter() - start, log_path)
+
+
+def run_matrix(
+    instances: List[MatrixInstance], release_file: Path, log_dir: Path, jobs: int
+) -> List[InstanceResult]:
+    """Run at most jobs instances at once, and print every instance as it finishes.
+    The results are in the order of the instances.
+    """
+    release_file = release_file.resolve()
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_dir = log_dir.resolve()
+    names = assign_names(instances)
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(run_instance, name, instance, release_file, log_dir): name
+            for name, instance in zip(names, instances)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.name] = result
+            if result.returncode == 0:
+                click.echo(f"✅ {result.name} ({result.seconds:.1f}s)")
+            else:
+                click.secho(f"❌ {result.name} failed, see {result.log_path}", fg="red")
+    return [results[name] for name in names]
+
+
+def format_summary(results: List[InstanceResult]) -> str:
+    rows = [("Instance", "Result", "Duration", "Log")]
+    for result in results:
+        status = "ok" if result.returncode == 0 else f"failed ({result.returncode})"
+        rows.append(
+            (result.name, status, f"{result.seconds:.1f}s", str(result.log_path))
+        )
+    widths = [max(len(row[column]) for row in rows) for column in range(3)]
+    lines = []
+    for row in rows:
+        cells = [cell.ljust(width) for cell, width in zip(row, widths)]
+        lines.append("  ".join(cells + [row[3]]))
+    return "\n".join(lines)
@@ -1,7 +1,9 @@
+import functools
 from string import Template
-from typing import Mapping
+from typing import FrozenSet, Iterator, List, Mapping, Optional, Tuple, Type
 
 from .types import Variables
+from .values import PreviewView
 
 
 class EnvTemplate(Template):
@@ -13,10 +15,105 @@ class EnvTemplate(Template):
     braceidpattern = rf"(?:env\.)?{Template.idpattern}"
 
 
+class EnvView(Mapping[str, str]):
+    """Variables and the environment variables with "env." prefix, without copying
+    the environment into a new dict for every render.
+    """
+
+    def __init__(self, variables: Variables, env: Mapping[str, str]):
+        self._variables = variables
+        self._env = env
+
+    def __getitem__(self, key: str) -> str:
+        if key in self._variables:
+            return self._variables[key]
+        if key.startswith("env."):
+            return self._env[key[4:]]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._variables
+        for key in self._env:
+            yield f"env.{key}"
+
+    def __len__(self) -> int:
+        return len(self._variables) + len(self._env)
+
+
+class CompiledTemplate:
+    """A template parsed once into pieces of literal text and references, so
+    rendering only looks up the referenced names.
+    Substitution works like Template.safe_substitute.
+    """
+
+    def __init__(self, text: str, template_class: Type[Template] = Template):
+        self.text = text
+        # literal text before the reference, referenced name, text of the reference
+        self._parts: List[Tuple[str, Optional[str], str]] = []
+        identifiers = set()
+        literal = []
+        position = 0
+        for match in template_class.pattern.finditer(text):
+            literal.append(text[position : match.start()])
+            position = match.end()
+            name = match.group("named") or match.group("braced")
+            if name is not None:
+                self._parts.append(("".join(literal), name, match.group()))
+                identifiers.add(name)
+                literal = []
+            elif match.group("escaped") is not None:
+                literal.append(template_class.delimiter)
+            else:
+                # invalid placeholder, left as it is
+                literal.append(match.group())
+        literal.append(text[position:])
+        self._tail = "".join(literal)
+        self.identifiers: FrozenSet[str] = frozenset(identifiers)
+
+    @property
+    def only_reference(self) -> Optional[str]:
+        """The name when the template is a single reference, like "$name"."""
+        if len(self._parts) == 1 and not self._parts[0][0] and not self._tail:
+            return self._parts[0][1]
+        return None
+
+    def render(self, mapping: Mapping[str, str]) -> str:
+        if not self._parts:
+            return self._tail
+        pieces = []
+        for literal, name, reference in self._parts:
+            pieces.append(literal)
+            try:
+                pieces.append(str(mapping[name]))
+            except KeyError:
+                pieces.append(reference)
+        pieces.append(self._tail)
+        return "".join(pieces)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(
+    text: str, template_class: Type[Template] = Template
+) -> CompiledTemplate:
+    return CompiledTemplate(text, template_class)
+
+
 def render_with_envvars(text: str, variables: Variables, env: Mapping[str, str]):
-    envvars = {f"env.{k}": v for k, v in env.items()}
-    return EnvTemplate(text).safe_substitute({**envvars, **variables})
+    template = compile_template(text, EnvTemplate)
+    return template.render(EnvView(variables, env))
 
 
 def render_text(text: str, variables: Variables) -> str:
-    return Template(text).safe_substitute(variables)
+    return compile_template(text).render(variables)
+
+
+def render_preview(text: str, variables: Variables) -> str:
+    """Render text which is only displayed, with previews of large values."""
+    return compile_template(text).render(PreviewView(variables))
+
+
+def get_identifiers(
+    text: str, template_class: Type[Template] = Template
+) -> FrozenSet[str]:
+    """Names of the variables referenced in a template."""
+    return compile_template(text, template_class).identifiers
@@ -0,0 +1,157 @@
+"""Spans and counters showing where the time of a run goes.
+
+Instrumented code calls span() and count() unconditionally; until enable() is
+called they only check a global and return, so they cost close to nothing.
+The recorded profile is written as a Chrome trace (open it in chrome://tracing
+or https://ui.perfetto.dev) and as a JSON summary by span name.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_profiler: Optional["Profiler"] = None
+
+
+def _peak_rss_kb() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        # only available on POSIX systems
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    def __init__(self, profiler: "Profiler", name: str, args: Dict[str, Any]):
+        self._profiler = profiler
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        """Add arguments known only at the end of the span, like a result size."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        self._cpu_start = time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        cpu = time.thread_time_ns() - self._cpu_start
+        self._profiler.add_span(self, self._start, end, cpu)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.start = time.perf_counter_ns()
+        self.events: List[dict] = []
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _timestamp(self, ns: int) -> float:
+        # microseconds from the start, the unit of Chrome traces
+        return (ns - self.start) / 1000
+
+    def add_span(self, span: Span, start: int, end: int, cpu: int):
+        event = {
+            "name": span.name,
+            "ph": "X",
+            "ts": self._timestamp(start),
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {**span.args, "cpu_ms": cpu / 1e6, "peak_rss_kb": _peak_rss_kb()},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def count(self, name: str, value: int):
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append(
+                {
+                    "name": name,
+                    "ph": "C",
+                    "ts": self._timestamp(time.perf_counter_ns()),
+                    "pid": os.getpid(),
+                    "args": {name: total},
+                }
+            )
+
+    def get_summary(self) -> dict:
+        spans: Dict[str, dict] = {}
+        for event in self.events:
+            if event["ph"] != "X":
+                continue
+            summary = spans.setdefault(
+                event["name"],
+                {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "max_wall_ms": 0.0},
+            )
+            wall_ms = event["dur"] / 1000
+            summary["count"] += 1
+            summary["wall_ms"] += wall_ms
+            summary["cpu_ms"] += event["args"]["cpu_ms"]
+            summary["max_wall_ms"] = max(summary["max_wall_ms"], wall_ms)
+        return {
+            "wall_ms": (time.perf_counter_ns() - self.start) / 1e6,
+            "peak_rss_kb": _peak_rss_kb(),
+            "spans": spans,
+            "counters": dict(self.counters),
+        }
+
+    def write(self, path: Path) -> Path:
+        """Write the Chrome trace to path, and the summary next to it.
+        Returns the path of the summary.
+        """
+        with self._lock:
+            events = list(self.events)
+        path.write_text(json.dumps({"traceEvents": events}))
+        summary_path = path.with_name(f"{path.stem}.summary.json")
+        summary_path.write_text(json.dumps(self.get_summary(), indent=2) + "\n")
+        return summary_path
+
+
+def enable() -> Profiler:
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+def span(name: str, **args):
+    """Context manager recording the wall and CPU time of the block."""
+    if _profiler is None:
+        return _NO_SPAN
+    return Span(_profiler, name, args)
+
+
+def count(name: str, value: int = 1):
+    if _profiler is not None:
+        _profiler.count(name, value)
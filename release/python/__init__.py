@@ -0,0 +1,11 @@
+from .config import PythonConfig as PythonConfig
+
+
+def __getattr__(name: str):
+    # the worker pool machinery is only imported when a python step actually runs
+    if name in ("run_step", "start_worker_pool"):
+        from . import run
+
+        value = globals()[name] = getattr(run, name)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,68 @@
+import hashlib
+import marshal
+from importlib.util import MAGIC_NUMBER
+from types import CodeType
+from typing import Dict, Set, Tuple
+
+from ..cache import DiskCache, get_cache_dir
+
+# the mode the code was compiled in ("eval" or "exec") and the code
+Compiled = Tuple[str, CodeType]
+
+_compiled: Dict[str, Compiled] = {}
+
+
+def get_code_key(source: str) -> str:
+    # compiled code can only be loaded by the same Python version
+    return hashlib.sha256(MAGIC_NUMBER + source.encode()).hexdigest()
+
+
+def _compile(source: str) -> Compiled:
+    try:
+        return "eval", compile(source, "<python step>", "eval")
+    except SyntaxError:
+        return "exec", compile(source, "<python step>", "exec")
+
+
+def get_compiled(source: str) -> Compiled:
+    """Compiled code of the source, cached in memory and on disk, so repeated runs
+    and TUI restarts don't compile the same code again.
+    """
+    key = get_code_key(source)
+    compiled = _compiled.get(key)
+    if compiled is not None:
+        return compiled
+
+    cache = DiskCache(get_cache_dir("python"), serializer=marshal, suffix=".marshal")
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = _compile(source)
+        cache.put(key, compiled)
+
+    _compiled[key] = compiled
+    return compiled
+
+
+def load_compiled(key: str, compiled_bytes: bytes) -> Compiled:
+    """Compiled code sent to a worker process, cached there by its key."""
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = marshal.loads(compiled_bytes)
+    return compiled
+
+
+def get_code_names(source: str) -> Set[str]:
+    """Global names used by the code, which can be variables."""
+    try:
+        _, code = get_compiled(source)
+    except SyntaxError:
+        return set()
+    return _get_names(code)
+
+
+def _get_names(code: CodeType) -> Set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _get_names(const)
+    return names
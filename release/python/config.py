@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class PythonConfig(BaseModel):
+    # an expression, or statements which assign the value to "result"
+    code: str
+    # run in a pre-started worker process instead of the release process
+    isolated: bool = False
@@ -0,0 +1,64 @@
+import atexit
+import marshal
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from ..types import Variables
+from ..values import inline_values
+from .code import Compiled, get_code_key, get_code_names, get_compiled, load_compiled
+from .config import PythonConfig
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _execute(compiled: Compiled, variables: Variables) -> Any:
+    mode, code = compiled
+    namespace = {**variables, "variables": variables}
+    if mode == "eval":
+        return eval(code, namespace)
+    exec(code, namespace)
+    return namespace.get("result")
+
+
+def _run_in_worker(key: str, compiled_bytes: bytes, variables: Variables) -> Any:
+    return _execute(load_compiled(key, compiled_bytes), variables)
+
+
+def _noop():
+    pass
+
+
+def start_worker_pool(num_workers: int = 2) -> ProcessPoolExecutor:
+    """Start the worker processes for isolated steps ahead of time."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(num_workers, mp_context=context)
+            for _ in range(num_workers):
+                _pool.submit(_noop)
+        return _pool
+
+
+@atexit.register
+def _shutdown_worker_pool():
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+
+
+def run_step(python_config: PythonConfig, variables: Variables) -> str:
+    compiled = get_compiled(python_config.code)
+    # the code gets the large values it uses as strings, like templates do
+    names = get_code_names(python_config.code)
+    variables = inline_values(variables, None if "variables" in names else names)
+    if python_config.isolated:
+        key = get_code_key(python_config.code)
+        pool = start_worker_pool()
+        future = pool.submit(_run_in_worker, key, marshal.dumps(compiled), variables)
+        result = future.result()
+    else:
+        result = _execute(compiled, dict(variables))
+    return "" if result is None else str(result)
@@ -0,0 +1,91 @@
+"""Run the action of a step in every environment of the step, a few at a time.
+The canary environments run first, then the others in batches, and every stage
+only starts when the previous one succeeded.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List
+
+from .config import Environment, RolloutConfig, Step
+from .parser import render_text
+from .types import Variables
+
+Echo = Callable[[str], None]
+# runs the action with the variables of an environment, and returns its output
+RunInEnvironment = Callable[[Variables, Echo], str]
+
+
+class RolloutError(Exception):
+    pass
+
+
+def get_stages(
+    environments: List[Environment], rollout: RolloutConfig
+) -> List[List[Environment]]:
+    canaries = environments[: rollout.canary]
+    rest = environments[rollout.canary :]
+    batch_size = rollout.batch_size or len(rest)
+    stages = [canaries] if canaries else []
+    stages += [rest[i : i + batch_size] for i in range(0, len(rest), batch_size)]
+    return stages
+
+
+def get_environment_variables(env: Environment, variables: Variables) -> Variables:
+    """The variables of the step in the environment. The variables of the
+    environment are rendered in order, so they can reference the earlier ones.
+    """
+    env_variables = {**variables, "environment": env.name}
+    for name, value in env.variables.items():
+        env_variables[name] = render_text(value, env_variables)
+    return env_variables
+
+
+def run_rollout(
+    step: Step, variables: Variables, run: RunInEnvironment, echo: Echo
+) -> str:
+    """Run the step in its environments, and return the outputs as a JSON object
+    by environment name. Raises RolloutError when it failed in any of them, after
+    the running ones finished; the later stages are not started.
+    """
+    stages = get_stages(step.environments, step.rollout)
+    outputs = {}
+    with ThreadPoolExecutor(max_workers=step.rollout.concurrency) as executor:
+        for number, stage in enumerate(stages, start=1):
+            if len(stages) > 1:
+                names = ", ".join(env.name for env in stage)
+                echo(f"Stage {number}/{len(stages)}: {names}")
+            futures = {
+                executor.submit(
+                    run,
+                    get_environment_variables(env, variables),
+                    lambda line, name=env.name: echo(f"[{name}] {line}"),
+                ): env
+                for env in stage
+            }
+            failed = []
+            for future in as_completed(futures):
+                name = futures[future].name
+                if future.cancelled():
+                    continue
+                try:
+                    outputs[name] = future.result()
+                except Exception as e:
+                    echo(f"[{name}] failed: {e}")
+                    failed.append(name)
+                    # the environments of the stage which didn't start yet
+                    for other in futures:
+                        other.cancel()
+                else:
+                    echo(f"[{name}] finished")
+
+            if failed:
+                skipped = len(step.environments) - len(outputs) - len(failed)
+                message = f"Failed in {', '.join(failed)}"
+                if skipped:
+                    message += f", skipped {skipped} environments"
+                raise RolloutError(message)
+
+    # large outputs are inlined, the result is one JSON document
+    outputs = {env.name: str(outputs[env.name]) for env in step.environments}
+    return json.dumps(outputs)
@@ -1,2 +1,14 @@
 from .config import RunConfig as RunConfig
-from .run import run as run
+
+
+def __getattr__(name: str):
+    # asyncio and subprocess are only imported when a run step actually runs
+    if name in ("run", "run_async", "get_output", "RunError"):
+        from .output import RunError
+        from .run import get_output, run, run_async
+
+        globals().update(
+            run=run, run_async=run_async, get_output=get_output, RunError=RunError
+        )
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,17 +1,25 @@
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, Optional
 
 from pydantic import BaseModel, root_validator
 
-from ..types import Variables
-
 
 class RunConfig(BaseModel):
     chdir: Path = Path.cwd()
-    env: Variables = {}
+    env: Dict[str, str] = {}
 
     command: Optional[str] = None
     script: Optional[str] = None
+    # seconds, after which the process is killed
+    timeout: Optional[float] = None
+    # run in a long-lived shell shared by the run steps with the same session name,
+    # chdir and env, so cd and export stay in effect for the next steps. The
+    # state is lost when a script fails, which exits the shell, and it isn't
+    # restored by --resume, which starts new shells
+    session: Optional[str] = None
+    # written to the standard input of the process; a single variable like
+    # "$shortlog" is streamed without reading a large value into memory
+    stdin: Optional[str] = None
 
     @root_validator(pre=True)
     def validate_at_least_one_command(cls, values):
@@ -23,3 +31,17 @@ class RunConfig(BaseModel):
             raise ValueError(f"Only one of {run_types!r} can be specified in one Step")
 
         return values
+
+    @root_validator(skip_on_failure=True)
+    def validate_stdin(cls, values):
+        if values.get("stdin") is not None and values.get("session"):
+            raise ValueError("stdin can't be used with a session")
+        return values
+
+    def iter_templates(self) -> Iterator[str]:
+        if self.command:
+            yield self.command
+        if self.script:
+            yield self.script
+        if self.stdin:
+            yield self.stdin
@@ -0,0 +1,115 @@
+import codecs
+import os
+import tempfile
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from ..values import FileValue, Value
+
+# called with the name of the stream ("stdout" or "stderr") and the line
+# without the line ending
+OnLine = Callable[[str, str], None]
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 1024 * 1024
+# longer lines are split, so output without newlines, like progress bars
+# redrawn with \r, is not collected in memory
+MAX_LINE_SIZE = 64 * 1024
+
+
+class RunError(Exception):
+    def __init__(self, message: str, returncode: Optional[int] = None):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+class LineDecoder:
+    """Decode chunks of bytes and split them into lines, keeping the line endings."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._partial = ""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Complete lines of the chunk. An empty chunk means the end of the stream,
+        so the last line without line ending is returned too. Lines longer than
+        MAX_LINE_SIZE are returned in parts, the parts without line ending.
+        """
+        text = self._partial + self._decoder.decode(chunk, final=not chunk)
+        *lines, self._partial = text.split("\n")
+        lines = [line + "\n" for line in lines]
+        if (not chunk and self._partial) or len(self._partial) > MAX_LINE_SIZE:
+            lines.append(self._partial)
+            self._partial = ""
+        return lines
+
+
+class OutputBuffer:
+    """Output of one stream of a process.
+    Only the last max_size bytes (in UTF-8) are kept in memory. When the output
+    grows bigger, the whole output is written to a temporary file too.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.spill_path: Optional[str] = None
+        self._spill_file = None
+        self._lines = deque()
+        self._buffered_size = 0
+
+    def append(self, line: str):
+        line_size = len(line.encode())
+        self.size += line_size
+        if self._spill_file is None and self.size > self.max_size:
+            # nothing was dropped from the buffer yet, it has the whole output
+            fd, self.spill_path = tempfile.mkstemp(prefix="release-", suffix=".log")
+            self._spill_file = os.fdopen(fd, "w", encoding="utf-8", newline="")
+            self._spill_file.writelines(line for line, _ in self._lines)
+        if self._spill_file is not None:
+            self._spill_file.write(line)
+
+        self._lines.append((line, line_size))
+        self._buffered_size += line_size
+        while self._buffered_size > self.max_size and len(self._lines) > 1:
+            self._buffered_size -= self._lines.popleft()[1]
+
+    def tail(self) -> str:
+        """The end of the output which is still in memory."""
+        return "".join(line for line, _ in self._lines)
+
+    def getvalue(self) -> str:
+        if self._spill_file is None:
+            return self.tail()
+        self._spill_file.flush()
+        with open(self.spill_path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+
+    def take_value(self) -> Value:
+        """Like getvalue(), but a large output is not read into memory: the file
+        it was written to is handed over to a FileValue.
+        """
+        if self._spill_file is None:
+            return self.tail()
+        self._spill_file.close()
+        self._spill_file = None
+        return FileValue(Path(self.spill_path))
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            os.unlink(self.spill_path)
+            self._spill_file = None
+
+
+@dataclass
+class RunResult:
+    returncode: int
+    stdout: OutputBuffer
+    stderr: OutputBuffer
+
+    def close(self):
+        self.stdout.close()
+        self.stderr.close()
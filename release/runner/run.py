@@ -1,33 +1,164 @@
+import asyncio
 import os
-import subprocess
+import signal
+from typing import Optional
 
+from .. import profiling
+from ..parser import compile_template, render_text
 from ..types import Variables
+from ..values import FileValue, Value
 from .config import RunConfig
+from .output import (
+    CHUNK_SIZE,
+    DEFAULT_MAX_SIZE,
+    LineDecoder,
+    OnLine,
+    OutputBuffer,
+    RunError,
+    RunResult,
+)
+from .session import get_session
 
+# characters of the end of the stderr shown in the error of a failed command
+ERROR_STDERR_SIZE = 4096
 
-def run_command(command: str, env: Variables) -> subprocess.Popen:
-    proc = subprocess.Popen(
-        command,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        env=env,
-        bufsize=0,
+
+async def _read_lines(
+    stream: asyncio.StreamReader,
+    name: str,
+    buffer: OutputBuffer,
+    on_line: Optional[OnLine],
+):
+    # reading chunks instead of readline(), which fails on very long lines
+    decoder = LineDecoder()
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        profiling.count("runner.output_bytes", len(chunk))
+        for line in decoder.feed(chunk):
+            buffer.append(line)
+            if on_line is not None:
+                on_line(name, line.rstrip("\r\n"))
+        if not chunk:
+            return
+
+
+def render_command(config: RunConfig, variables: Variables) -> str:
+    with profiling.span("render"):
+        if config.command:
+            return render_text(config.command, variables)
+        elif config.script:
+            return render_text(config.script, variables)
+        else:
+            raise ValueError
+
+
+def get_stdin(config: RunConfig, variables: Variables) -> Optional[Value]:
+    if config.stdin is None:
+        return None
+    name = compile_template(config.stdin).only_reference
+    if name is not None and name in variables:
+        return variables[name]
+    return render_text(config.stdin, variables)
+
+
+async def _write_stdin(stream: asyncio.StreamWriter, value: Value):
+    chunks = value.iter_chunks() if isinstance(value, FileValue) else [value.encode()]
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+            await stream.drain()
+        stream.close()
+        await stream.wait_closed()
+    except (BrokenPipeError, ConnectionResetError):
+        # the process exited without reading everything
+        pass
+
+
+async def _start_process(config: RunConfig, variables: Variables):
+    kwargs = dict(
+        stdin=asyncio.subprocess.DEVNULL
+        if config.stdin is None
+        else asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=config.chdir,
+        env={**os.environ, **config.env},
+        # own process group, so the children of the shell can be killed too
+        start_new_session=True,
     )
-    os.set_blocking(proc.stdout.fileno(), False)
-    os.set_blocking(proc.stderr.fileno(), False)
-    return proc
+    command = render_command(config, variables)
+    if config.script:
+        return await asyncio.create_subprocess_exec("/bin/sh", "-ec", command, **kwargs)
+    return await asyncio.create_subprocess_shell(command, **kwargs)
+
+
+async def run_async(
+    config: RunConfig,
+    variables: Variables,
+    on_line: Optional[OnLine] = None,
+    max_size: int = DEFAULT_MAX_SIZE,
+) -> RunResult:
+    """Run the command or script and stream its output line by line to on_line.
+    The process is killed on timeout, on cancellation or when on_line raises.
+    """
+    stdin = get_stdin(config, variables)
+    proc = await _start_process(config, variables)
+    result = RunResult(-1, OutputBuffer(max_size), OutputBuffer(max_size))
+    tasks = [
+        _read_lines(proc.stdout, "stdout", result.stdout, on_line),
+        _read_lines(proc.stderr, "stderr", result.stderr, on_line),
+        proc.wait(),
+    ]
+    if stdin is not None:
+        tasks.append(_write_stdin(proc.stdin, stdin))
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), config.timeout)
+    except BaseException as e:
+        if proc.returncode is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                # exited since, and there are no children left in the group
+                pass
+            await proc.wait()
+        result.close()
+        if isinstance(e, asyncio.TimeoutError):
+            raise RunError(f"Timed out after {config.timeout} seconds") from None
+        raise
 
+    result.returncode = proc.returncode
+    return result
 
-def run_script(script: str) -> subprocess.Popen: ...
 
+def get_output(result: RunResult) -> Value:
+    """The stdout of a successful run, a FileValue when it's large. Raises
+    RunError when the command failed. The result is closed either way.
+    """
+    try:
+        if result.returncode != 0:
+            message = f"Command failed with exit code {result.returncode}"
+            stderr = result.stderr.tail().strip()
+            if len(stderr) > ERROR_STDERR_SIZE:
+                stderr = "…" + stderr[-ERROR_STDERR_SIZE:]
+            if stderr:
+                message += f":\n{stderr}"
+            raise RunError(message, result.returncode)
+        return result.stdout.take_value()
+    finally:
+        result.close()
 
-def run(config: RunConfig):
-    if config.command:
-        proc = run_command(config.command, config.env)
-    elif config.script:
-        proc = run_script(config.script)
-    else:
-        raise ValueError
 
-    return stdout, stderr
+def run(
+    config: RunConfig, variables: Variables, on_line: Optional[OnLine] = None
+) -> Value:
+    with profiling.span("runner.run", session=config.session) as run_span:
+        if config.session:
+            session = get_session(config.session, config.chdir, config.env)
+            command = render_command(config, variables)
+            result = session.run(
+                command, on_line, config.timeout, errexit=bool(config.script)
+            )
+        else:
+            result = asyncio.run(run_async(config, variables, on_line))
+        run_span.set(returncode=result.returncode, stdout_bytes=result.stdout.size)
+        return get_output(result)
@@ -0,0 +1,206 @@
+import atexit
+import os
+import secrets
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .. import profiling
+from ..types import Variables
+from .output import (
+    CHUNK_SIZE,
+    DEFAULT_MAX_SIZE,
+    LineDecoder,
+    OnLine,
+    OutputBuffer,
+    RunError,
+    RunResult,
+)
+
+SessionKey = Tuple[str, Path, Tuple[Tuple[str, str], ...]]
+
+_sessions: Dict[SessionKey, "ShellSession"] = {}
+_lock = threading.Lock()
+
+
+class _Stream:
+    """Output of one stream of the shell until the end marker of the command."""
+
+    def __init__(self, name: str, buffer: OutputBuffer, on_line: Optional[OnLine]):
+        self.name = name
+        self.buffer = buffer
+        self.on_line = on_line
+        self.decoder = LineDecoder()
+        self.finished = False
+        self.marker_args = ""
+        # the newline printed before the marker is not part of the output, so the
+        # last line can only be emitted after we know if the marker follows it
+        self._held_line: Optional[str] = None
+
+    def _emit(self, line: str):
+        self.buffer.append(line)
+        if self.on_line is not None:
+            self.on_line(self.name, line.rstrip("\r\n"))
+
+    def feed(self, chunk: bytes, marker: str):
+        for line in self.decoder.feed(chunk):
+            if line.startswith(marker):
+                self.marker_args = line[len(marker) :].strip()
+                if self._held_line and self._held_line != "\n":
+                    self._emit(self._held_line[:-1])
+                self._held_line = None
+                self.finished = True
+                continue
+            if self._held_line is not None:
+                self._emit(self._held_line)
+            self._held_line = line
+
+    def end(self):
+        """The shell exited before printing the marker."""
+        for line in self.decoder.feed(b""):
+            if self._held_line is not None:
+                self._emit(self._held_line)
+            self._held_line = line
+        if self._held_line is not None:
+            self._emit(self._held_line)
+        self._held_line = None
+        self.finished = True
+
+
+class ShellSession:
+    """A long-lived shell which runs commands one after the other, so run steps
+    don't start a new process each and cd or export stays in effect between them.
+    After each command, an end marker with the exit code is printed to stdout and
+    an end marker to stderr, which separate the outputs of the commands.
+    """
+
+    def __init__(self, chdir: Path, env: Variables):
+        self._proc = subprocess.Popen(
+            ["/bin/sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=chdir,
+            env={**os.environ, **env},
+            start_new_session=True,
+        )
+        self._marker = f"__release_session_{secrets.token_hex(8)}__"
+        self.lock = threading.Lock()
+
+    @property
+    def is_alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def run(
+        self,
+        command: str,
+        on_line: Optional[OnLine] = None,
+        timeout: Optional[float] = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        errexit: bool = False,
+    ) -> RunResult:
+        """With errexit, the command stops at the first failing command like with
+        /bin/sh -e outside of a session. The shell itself exits then, and the
+        next command of the session starts a new one, without the working
+        directory and variables of the old one.
+        """
+        if errexit:
+            command = f"set -e\n{command}\nset +e"
+        # braces run the command in the shell itself, not in a subshell
+        script = (
+            f"{{\n{command}\n}} </dev/null\n"
+            f"printf '\\n{self._marker} %d\\n' $?\n"
+            f"printf '\\n{self._marker}\\n' >&2\n"
+        )
+        result = RunResult(-1, OutputBuffer(max_size), OutputBuffer(max_size))
+        with self.lock:
+            try:
+                self._proc.stdin.write(script.encode())
+                self._proc.stdin.flush()
+                self._read_output(result, on_line, timeout, errexit)
+            except BaseException:
+                # the state of the shell is unknown, it can't run more commands
+                self.close()
+                result.close()
+                raise
+            if not self.is_alive:
+                self.close()
+        return result
+
+    def _read_output(
+        self,
+        result: RunResult,
+        on_line: Optional[OnLine],
+        timeout: Optional[float],
+        errexit: bool,
+    ):
+        streams = {
+            self._proc.stdout.fileno(): _Stream("stdout", result.stdout, on_line),
+            self._proc.stderr.fileno(): _Stream("stderr", result.stderr, on_line),
+        }
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            for fd in streams:
+                selector.register(fd, selectors.EVENT_READ)
+            while not all(stream.finished for stream in streams.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RunError(f"Timed out after {timeout} seconds")
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, CHUNK_SIZE)
+                    if not chunk and errexit:
+                        # a command failed, and set -e made the shell exit
+                        streams[key.fd].end()
+                        selector.unregister(key.fd)
+                        continue
+                    if not chunk:
+                        returncode = self._proc.wait()
+                        raise RunError(
+                            f"Shell session exited with code {returncode}", returncode
+                        )
+                    profiling.count("runner.output_bytes", len(chunk))
+                    stream = streams[key.fd]
+                    stream.feed(chunk, self._marker)
+                    if stream.finished:
+                        selector.unregister(key.fd)
+
+        stdout = streams[self._proc.stdout.fileno()]
+        if stdout.marker_args:
+            result.returncode = int(stdout.marker_args)
+        else:
+            result.returncode = self._proc.wait()
+
+    def close(self):
+        if self._proc.poll() is None:
+            try:
+                os.killpg(self._proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._proc.wait()
+        for pipe in self._proc.stdin, self._proc.stdout, self._proc.stderr:
+            pipe.close()
+
+
+def get_session(name: str, chdir: Path, env: Variables) -> ShellSession:
+    """The shell session of the name for the directory and environment.
+    A new shell is started when there is none yet or the previous one exited.
+    """
+    key = (name, Path(chdir).resolve(), tuple(sorted(env.items())))
+    with _lock:
+        session = _sessions.get(key)
+        if session is None or not session.is_alive:
+            session = _sessions[key] = ShellSession(chdir, env)
+        return session
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,157 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+import click
+
+from . import profiling
+from .config import Step
+from .parser import get_identifiers
+from .python.code import get_code_names
+from .steps import (
+    RESUMED,
+    echo_cache_stats,
+    format_description,
+    format_title,
+    run_action,
+)
+from .types import Variables
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+
+def get_references(step: Step) -> Set[str]:
+    """Names of the variables the step uses."""
+    names = set()
+    for text in step.iter_templates():
+        names |= get_identifiers(text)
+    if step.python:
+        names |= get_code_names(step.python.code)
+    return names
+
+
+def get_dependencies(steps: List[Step]) -> List[Set[int]]:
+    """Indexes of the steps each step has to wait for.
+    Besides the explicit depends_on ids, a step depends on the step which set the
+    variables it references, and a step setting a variable depends on the earlier
+    steps which read or set the same variable. Run steps of a session run in
+    order, each after the previous one of the same session, whose cd and export
+    it sees.
+    """
+    step_indexes = {step.id: i for i, step in enumerate(steps) if step.id}
+    setters: Dict[str, int] = {}
+    readers: Dict[str, Set[int]] = {}
+    # session name -> the last step running in it
+    sessions: Dict[str, int] = {}
+    dependencies = []
+
+    for i, step in enumerate(steps):
+        step_dependencies = {step_indexes[step_id] for step_id in step.depends_on}
+        if step.run and step.run.session:
+            if step.run.session in sessions:
+                step_dependencies.add(sessions[step.run.session])
+            sessions[step.run.session] = i
+        for name in get_references(step):
+            if name in setters:
+                step_dependencies.add(setters[name])
+            readers.setdefault(name, set()).add(i)
+        if step.set_variable:
+            name = step.set_variable
+            if name in setters:
+                step_dependencies.add(setters[name])
+            step_dependencies |= readers.pop(name, set()) - {i}
+            setters[name] = i
+        dependencies.append(step_dependencies)
+
+    return dependencies
+
+
+def _run_step(stepnum: int, step: Step, variables: Variables, lines: List[str]) -> str:
+    """Run the step, and collect its output in lines, also when it fails."""
+    with profiling.span("step", number=stepnum, title=step.title):
+        with profiling.span("render"):
+            lines.append(format_title(stepnum, step.title, variables))
+            if step.description:
+                lines.append(format_description(step.description, variables))
+        return run_action(step, variables, lines.append)
+
+
+def run_steps_concurrently(
+    steps: List[Step],
+    variables: Variables,
+    jobs: int,
+    journal: Optional["Journal"] = None,
+    completed: Optional[Dict[int, str]] = None,
+):
+    """Run steps without waiting for input, independent steps at the same time on
+    at most jobs threads. The output of the steps is printed in step order, and
+    no new steps are started after one failed. Steps in completed are not run
+    again, only their output is set.
+    """
+    dependencies = get_dependencies(steps)
+    finished: Set[int] = set()
+    logs: Dict[int, List[str]] = {}
+    next_to_print = 0
+
+    for i, output in sorted((completed or {}).items()):
+        logs[i] = [format_title(i + 1, steps[i].title, variables), RESUMED]
+        if steps[i].set_variable:
+            variables[steps[i].set_variable] = output
+        finished.add(i)
+
+    def print_finished():
+        nonlocal next_to_print
+        while next_to_print in logs:
+            for line in logs.pop(next_to_print):
+                click.echo(line)
+            click.echo("✅\n")
+            next_to_print += 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running: Dict[Future, int] = {}
+        # output of the running steps
+        step_lines: Dict[int, List[str]] = {}
+        waiting = [i for i in range(len(steps)) if i not in finished]
+
+        def submit_ready():
+            for i in list(waiting):
+                if dependencies[i] <= finished:
+                    waiting.remove(i)
+                    if journal is not None:
+                        journal.start(i, steps[i])
+                    step_lines[i] = []
+                    # every step gets its own copy, so variables set later by
+                    # other steps can't change it while running
+                    future = executor.submit(
+                        _run_step, i + 1, steps[i], dict(variables), step_lines[i]
+                    )
+                    running[future] = i
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=running.get):
+                i = running.pop(future)
+                lines = step_lines.pop(i)
+                try:
+                    output = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    print_finished()
+                    # the output shows why the step failed
+                    if not lines:
+                        lines = [format_title(i + 1, steps[i].title, variables)]
+                    for line in lines:
+                        click.echo(line)
+                    raise
+                if journal is not None:
+                    journal.finish(i, steps[i], output)
+                if steps[i].set_variable:
+                    variables[steps[i].set_variable] = output
+                logs[i] = lines
+                finished.add(i)
+            print_finished()
+            submit_ready()
+
+    echo_cache_stats(steps)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Set
+
+from . import git
+from .cache import DiskCache, get_cache_dir
+from .config import ACTIONS, Step
+from .parser import get_identifiers
+from .python.code import get_code_names
+from .types import Variables
+from .values import FileValue, Value, get_digest
+
+_cache: Optional[DiskCache] = None
+
+
+def get_step_cache() -> DiskCache:
+    """Outputs of the steps with cache enabled, shared by every release file."""
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(get_cache_dir("steps"))
+    return _cache
+
+
+def get_output(cache: DiskCache, key: str) -> Optional[Value]:
+    """The cached output of a step, large ones are copied from their file."""
+    output = cache.get(key)
+    if isinstance(output, dict):
+        try:
+            return FileValue.copy_of(cache.attachment_path(key))
+        except FileNotFoundError:
+            return None
+    return output
+
+
+def put_output(cache: DiskCache, key: str, output: Value):
+    """Store the output, a FileValue as a copy of its file without reading it."""
+    if isinstance(output, FileValue):
+        cache.put(key, {"file": True}, attachment=output.path)
+    else:
+        cache.put(key, output)
+
+
+def get_action_references(step: Step) -> Set[str]:
+    """Names of the variables the action of the step uses."""
+    names = set()
+    if step.git:
+        for text in step.git.iter_templates():
+            names |= get_identifiers(text)
+    elif step.run:
+        for text in step.run.iter_templates():
+            names |= get_identifiers(text)
+    elif step.gitlab:
+        for text in step.gitlab.iter_templates():
+            names |= get_identifiers(text)
+    elif step.python:
+        names |= get_code_names(step.python.code)
+    if step.open_url:
+        names |= get_identifiers(step.open_url)
+    for env in step.environments or []:
+        for text in env.variables.values():
+            names |= get_identifiers(text)
+    return names
+
+
+def get_repo_paths(step: Step, variables: Variables) -> List[Path]:
+    if step.git:
+        return git.get_repo_paths(step.git, variables)
+    elif step.run:
+        return [step.run.chdir]
+    return []
+
+
+def get_step_key(step: Step, variables: Variables) -> str:
+    """Hash of everything the output of the step depends on: the action config,
+    the values of the variables and environment variables it uses and the HEAD
+    of the repository it runs in. For run steps the uncommitted changes of the
+    working tree count too, other files the command reads are not checked.
+    """
+    digest = hashlib.sha256()
+    for action in ACTIONS:
+        config = getattr(step, action)
+        if config is not None:
+            digest.update(f"{action}:{config.json()}".encode())
+    if step.open_url:
+        digest.update(f"open_url:{step.open_url}".encode())
+
+    if step.environments:
+        environments = [env.dict() for env in step.environments]
+        digest.update(f"environments:{json.dumps(environments)}".encode())
+
+    names = get_action_references(step)
+    if step.python and "variables" in names:
+        # the code can read any of them through the variables dict
+        names = set(variables)
+    values = {name: variables.get(name) for name in names}
+    env = {name: os.environ.get(name) for name in step.cache.env}
+    # large values by their hash, without reading them into memory
+    digest.update(
+        json.dumps([values, env], sort_keys=True, default=get_digest).encode()
+    )
+
+    for repo_path in get_repo_paths(step, variables):
+        digest.update(f"{repo_path}:{git.get_repo_state(repo_path)}".encode())
+        if step.run:
+            worktree_state = git.get_worktree_state(repo_path)
+            digest.update(f"{repo_path}:{worktree_state}".encode())
+    return digest.hexdigest()
@@ -1,14 +1,24 @@
 import textwrap
-from typing import List, Optional
+import webbrowser
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 
 import click
 
-from . import git, runner
+from . import git, gitlab, profiling, python, runner
 from .config import Step
-from .parser import render_text
+from .parser import render_preview, render_text
+from .rollout import run_rollout
+from .stepcache import get_output, get_step_cache, get_step_key, put_output
 from .types import Variables
+from .values import Value, to_value
+
+if TYPE_CHECKING:
+    from .journal import Journal
 
 PADDING = " " * 4
+RESUMED = PADDING + "Finished in a previous run"
+
+Echo = Callable[[str], None]
 
 
 def wait_for_enter_press():
@@ -18,38 +28,142 @@ def wait_for_enter_press():
         char = click.getchar()
 
 
+def format_title(stepnum: int, title: str, variables: Variables) -> str:
+    title = render_preview(title, variables)
+    return click.style(f"{stepnum}. {title}", fg="yellow")
+
+
+def format_description(description: Optional[str], variables: Variables) -> str:
+    if not description:
+        return ""
+    description = render_preview(description, variables)
+    return textwrap.indent(description, PADDING)
+
+
 def print_title(stepnum: int, title: str, variables: Variables):
-    title = render_text(title, variables)
-    click.secho(f"{stepnum}. {title}", fg="yellow")
+    click.echo(format_title(stepnum, title, variables))
 
 
 def print_description(description: Optional[str], variables: Variables):
     if description:
-        description = render_text(description, variables)
-        indented_description = textwrap.indent(description, PADDING)
-        click.echo(indented_description)
+        click.echo(format_description(description, variables))
+
+
+def run_action(
+    step: Step,
+    variables: Variables,
+    echo: Echo = click.echo,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Value:
+    """on_progress is called with the number of commits walked by git steps.
+    With cache enabled, the output of a previous run with the same inputs is
+    returned without running the action. Large outputs are returned as FileValue.
+    """
+    with profiling.span("action", action=step.action) as action_span:
+        if not step.cache:
+            return to_value(_run_fanned_out(step, variables, echo, on_progress))
+
+        cache = get_step_cache()
+        key = get_step_key(step, variables)
+        output = get_output(cache, key)
+        action_span.set(cached=output is not None)
+        if output is not None:
+            echo(PADDING + "Cached result")
+            return output
+        output = to_value(_run_fanned_out(step, variables, echo, on_progress))
+        put_output(cache, key, output)
+        return output
 
 
-def run_action(step: Step, variables: Variables) -> str:
+def _run_fanned_out(
+    step: Step,
+    variables: Variables,
+    echo: Echo,
+    on_progress: Optional[Callable[[int], None]],
+) -> Value:
+    """Run the action once, or in every environment of the step."""
+    if not step.environments:
+        return _run_action(step, variables, echo, on_progress)
+
+    def run(env_variables: Variables, env_echo: Echo) -> str:
+        return _run_action(
+            step,
+            env_variables,
+            lambda line: env_echo(line.removeprefix(PADDING)),
+            None,
+        )
+
+    return run_rollout(step, variables, run, lambda line: echo(PADDING + line))
+
+
+def _run_action(
+    step: Step,
+    variables: Variables,
+    echo: Echo,
+    on_progress: Optional[Callable[[int], None]],
+) -> Value:
     if step.git:
-        output = git.run_step(step.git, variables)
+        output = git.run_step(step.git, variables, echo, on_progress)
     elif step.run:
         if step.run.command:
-            click.echo(PADDING + f"$ {step.run.command}")
-        output = runner.run(step.run)
+            echo(PADDING + "$ " + render_preview(step.run.command, variables))
+        output = runner.run(
+            step.run, variables, lambda stream, line: echo(PADDING + line)
+        )
+    elif step.python:
+        output = python.run_step(step.python, variables)
+    elif step.gitlab:
+        output = gitlab.run_step(
+            step.gitlab, variables, lambda line: echo(PADDING + line)
+        )
     else:
         output = ""
 
+    if step.open_url:
+        url = render_text(step.open_url, variables)
+        echo(PADDING + f"Opening {url}")
+        # without a browser, e.g. on CI, the URL is only printed
+        webbrowser.open(url)
+        # the output of a step which only opens the URL is the URL
+        if step.action is None:
+            output = url
+
     return output
 
 
-def run_steps(steps: List[Step], variables: Variables):
-    for stepnum, step in enumerate(steps, start=1):
-        print_title(stepnum, step.title, variables)
-        print_description(step.description, variables)
-        output = run_action(step, variables)
+def run_steps(
+    steps: List[Step],
+    variables: Variables,
+    journal: Optional["Journal"] = None,
+    completed: Optional[Dict[int, str]] = None,
+):
+    """Steps in completed are not run again, only their output is set."""
+    completed = completed or {}
+    for i, step in enumerate(steps):
+        with profiling.span("step", number=i + 1, title=step.title):
+            with profiling.span("render"):
+                print_title(i + 1, step.title, variables)
+            if i in completed:
+                click.echo(RESUMED)
+                output = completed[i]
+            else:
+                with profiling.span("render"):
+                    print_description(step.description, variables)
+                if journal is not None:
+                    journal.start(i, step)
+                output = run_action(step, variables)
+                if journal is not None:
+                    journal.finish(i, step, output)
         if step.set_variable:
             variables[step.set_variable] = output
 
-        wait_for_enter_press()
+        if i not in completed:
+            wait_for_enter_press()
         click.echo("✅\n")
+
+    echo_cache_stats(steps)
+
+
+def echo_cache_stats(steps: List[Step]):
+    if any(step.cache for step in steps):
+        click.echo(f"Step cache: {get_step_cache().stats}")
@@ -1,59 +1,162 @@
+import asyncio
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Dict, List, Optional
 
+import yaml
 from markdown_it import MarkdownIt
+from pydantic import ValidationError
+from rich.text import Text
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Horizontal, Vertical
 from textual.message import Message
-from textual.widgets import Footer, Header, Label, ListItem, ListView, Markdown, Static
+from textual.widgets import Footer, Header, Log, Markdown, OptionList, Static
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
+from . import profiling, runner
 from .config import load_release_config, parse_initial_variables
+from .journal import Journal, JournalState, get_journal_path
+from .parser import render_preview
+from .steps import run_action
+
+WATCHED_EVENTS = ("modified", "created", "moved")
+
+
+class CachingMarkdownIt(MarkdownIt):
+    """MarkdownIt which remembers the tokens of the recently parsed documents,
+    so moving back and forth between steps doesn't parse the same text again.
+    """
+
+    def __init__(self, maxsize=256):
+        super().__init__("commonmark", {"breaks": True})
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+
+    def parse(self, src, env=None):
+        if env is not None:
+            return super().parse(src, env)
+        if src in self._tokens:
+            self._tokens.move_to_end(src)
+            return self._tokens[src]
+        tokens = self._tokens[src] = super().parse(src)
+        if len(self._tokens) > self.maxsize:
+            self._tokens.popitem(last=False)
+        return tokens
+
+
+_markdown_parser = None
 
 
 def create_markdown_parser():
-    """Create a MarkdownIt parser configured to render newlines as line breaks"""
-    return MarkdownIt("commonmark", {"breaks": True})
+    """Create a MarkdownIt parser configured to render newlines as line breaks.
+    The same parser is returned every time, so its cache is shared.
+    """
+    global _markdown_parser
+    if _markdown_parser is None:
+        _markdown_parser = CachingMarkdownIt()
+    return _markdown_parser
+
+
+class StepCancelled(Exception):
+    """Raised in the thread of a running step when it was cancelled from the UI."""
 
 
 class TUIFileHandler(FileSystemEventHandler):
-    def __init__(self, restart_callback):
+    """Collect the changed Python and CSS files of the package and the release file,
+    and call the callback with them once no new event arrived for debounce seconds,
+    so an editor writing a file in several steps results in a single reload.
+    """
+
+    def __init__(self, changes_callback, package_path, release_file=None, debounce=0.2):
         super().__init__()
-        self.restart_callback = restart_callback
+        self.changes_callback = changes_callback
+        self.package_path = package_path
+        self.release_file = release_file
+        self.debounce = debounce
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def is_watched(self, path: Path) -> bool:
+        # other files next to the release file belong to the project
+        if path == self.release_file:
+            return True
+        return path.suffix in (".py", ".tcss") and path.is_relative_to(
+            self.package_path
+        )
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in WATCHED_EVENTS:
+            return
+        # editors often save by writing a temporary file and moving it in place
+        path = Path(getattr(event, "dest_path", "") or event.src_path).resolve()
+        if not self.is_watched(path):
+            return
+        with self._lock:
+            self._changed.add(path)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._timer = None
+        if changed:
+            self.changes_callback(changed)
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._changed.clear()
+
 
-    def on_modified(self, event):
-        if not event.is_directory and (
-            event.src_path.endswith(".py") or event.src_path.endswith(".tcss")
-        ):
-            self.restart_callback()
+def format_step_prompt(step_index: int, step) -> Text:
+    return Text(f"{step_index + 1}. {step.title}")
 
 
-class StepsList(ListView):
+def diff_steps(old_steps, new_steps) -> List[int]:
+    """Indexes of the steps which are in both lists but changed."""
+    return [i for i, (old, new) in enumerate(zip(old_steps, new_steps)) if old != new]
+
+
+class StepsList(OptionList):
+    """Only the visible rows are rendered, there are no widgets for the steps."""
+
     def __init__(self, steps, current_step_index=0, **kwargs):
-        super().__init__(**kwargs)
+        prompts = [format_step_prompt(i, step) for i, step in enumerate(steps)]
+        super().__init__(*prompts, **kwargs)
         self.steps = steps
         self.current_step_index = current_step_index
+        if steps:
+            self.highlighted = current_step_index
+
+    def update_steps(self, steps) -> None:
+        """Patch only the options of the steps which changed, were added or removed."""
+        for i in diff_steps(self.steps, steps):
+            if self.steps[i].title != steps[i].title:
+                self.replace_option_prompt_at_index(i, format_step_prompt(i, steps[i]))
+        for i in range(len(self.steps) - 1, len(steps) - 1, -1):
+            self.remove_option_at_index(i)
+        self.add_options(
+            format_step_prompt(i, steps[i]) for i in range(len(self.steps), len(steps))
+        )
+        self.steps = steps
 
-    def on_mount(self) -> None:
-        for i, step in enumerate(self.steps):
-            list_item = ListItem(Label(f"{i + 1}. {step.title}"))
-            self.append(list_item)
-        if self.steps:
-            # Schedule the index setting after the next refresh to ensure ListView is fully initialized
-            self.call_after_refresh(self._set_initial_selection)
-
-    def _set_initial_selection(self) -> None:
-        """Set the initial selection after the ListView is fully initialized"""
-        if 0 <= self.current_step_index < len(self.steps):
-            self.index = self.current_step_index
-
-    def on_list_view_highlighted(self, event: ListView.Highlighted) -> None:
-        """Handle step highlighting from the ListView"""
-        highlighted_index = event.list_view.index
-        if highlighted_index is not None:
-            self.post_message(self.StepSelected(highlighted_index))
+    def on_option_list_option_highlighted(
+        self, event: OptionList.OptionHighlighted
+    ) -> None:
+        """Handle step highlighting from the OptionList"""
+        event.stop()
+        self.post_message(self.StepSelected(event.option_index))
 
     class StepSelected(Message):
         """Message sent when a step is selected"""
@@ -75,6 +178,11 @@ class LeftPanel(Static):
             yield Static(progress_text, classes="steps-header", id="steps-header")
             yield StepsList(self.steps, self.current_step_index, classes="steps-list")
 
+    def update_steps(self, steps, current_step_index):
+        self.steps = steps
+        self.query_one(StepsList).update_steps(steps)
+        self.update_progress(current_step_index)
+
     def update_progress(self, current_step_index):
         """Update the progress display"""
         self.current_step_index = current_step_index
@@ -84,9 +192,11 @@ class LeftPanel(Static):
 
 
 class RightPanel(Static):
-    def __init__(self, current_step=None, **kwargs):
+    def __init__(self, current_step=None, variables=None, **kwargs):
         super().__init__(**kwargs)
         self.current_step = current_step
+        self.variables = variables or {}
+        self.description_text = None
 
     def compose(self) -> ComposeResult:
         with Vertical():
@@ -99,18 +209,21 @@ class RightPanel(Static):
                 header_text, classes="description-header", id="description-header"
             )
             description_text = (
-                self.current_step.description
+                render_preview(self.current_step.description, self.variables)
                 if self.current_step and self.current_step.description
                 else "No description available"
             )
+            self.description_text = description_text
             yield Markdown(
                 description_text,
                 parser_factory=create_markdown_parser,
                 classes="description-content",
                 id="description-content",
             )
+            yield Static("", classes="step-status", id="step-status")
+            yield Log(classes="step-output", id="step-output")
 
-    def update_description(self, step):
+    def update_description(self, step, variables):
         """Update the description content and header with a new step"""
         # Update header with step title
         header_widget = self.query_one("#description-header", Static)
@@ -118,41 +231,112 @@ class RightPanel(Static):
         header_widget.update(header_text)
 
         # Update description content
-        description_widget = self.query_one("#description-content", Markdown)
         description_text = (
-            step.description if step.description else "No description available"
+            render_preview(step.description, variables)
+            if step.description
+            else "No description available"
         )
+        self.current_step = step
+        if description_text == self.description_text:
+            return
+        self.description_text = description_text
+        description_widget = self.query_one("#description-content", Markdown)
         description_widget.update(description_text)
 
+    def update_status(self, status: str):
+        self.query_one("#step-status", Static).update(status)
+
+    def show_output(self, lines: List[str]):
+        """Replace the output with the lines of another step"""
+        log = self.query_one("#step-output", Log)
+        log.clear()
+        log.write_lines(lines)
+
+    def write_output(self, line: str):
+        self.query_one("#step-output", Log).write_line(line)
+
 
 class ReleaseApp(App):
     CSS_PATH = "tui.tcss"
     BINDINGS = [
         Binding("up", "move_up", "Move Up"),
         Binding("down", "move_down", "Move Down"),
+        Binding("r", "run_step", "Run Step"),
+        Binding("escape", "cancel_step", "Cancel"),
     ]
 
+    class StepOutput(Message):
+        """A line of output of a running step"""
+
+        def __init__(self, step_index: int, line: str):
+            super().__init__()
+            self.step_index = step_index
+            self.line = line
+
+    class StepProgress(Message):
+        """Number of commits walked so far by a running git step"""
+
+        def __init__(self, step_index: int, commits: int):
+            super().__init__()
+            self.step_index = step_index
+            self.commits = commits
+
     def __init__(
-        self, config_path=None, restart_on_change=False, initial_state=None, **kwargs
+        self,
+        config_path=None,
+        restart_on_change=False,
+        initial_state=None,
+        config_timings=None,
+        resume=False,
+        **kwargs,
     ):
         super().__init__(**kwargs)
         self.config_path = config_path or Path("nogit/release.yaml")
-        self.config = load_release_config(self.config_path)
+        self.config = load_release_config(self.config_path, config_timings)
+
+        self.step_outputs: Dict[int, List[str]] = {}
+        self.step_statuses: Dict[int, str] = {}
 
         # Initialize state from previous run or defaults
         if initial_state:
             self.current_step_index = initial_state.get("current_step_index", 0)
             self.variables = initial_state.get("variables")
+            self.journal_pending = initial_state.get("journal_pending", False)
+            # a step running at the restart was stopped with the old app
+            statuses = initial_state.get("step_statuses", {})
+            self.step_statuses.update(
+                (i, status)
+                for i, status in statuses.items()
+                if not status.startswith("Running")
+            )
         else:
             self.current_step_index = 0
             self.variables = None
-
-        # Initialize variables if not already set
+            self.journal_pending = False
+
+        # with resume, steps finished in the previous run are replayed from the journal
+        self.journal = Journal(get_journal_path(self.config_path))
+        journal_state = self.journal.replay() if resume else JournalState()
+        if self.variables is None and journal_state.variables is not None:
+            self.variables = journal_state.variables
+            completed = journal_state.get_completed(self.config.steps)
+            for step_index, output in completed.items():
+                step = self.config.steps[step_index]
+                if step.set_variable:
+                    self.variables[step.set_variable] = output
+                self.step_statuses[step_index] = "Finished in a previous run"
+
+        # Initialize variables if not already set. The new run only replaces the
+        # journal when its first step runs, so opening the TUI doesn't discard
+        # an interrupted run which could still be resumed
         if self.variables is None:
             self.variables = parse_initial_variables(self.config, os.environ)
+            self.journal_pending = True
 
         self.restart_on_change = restart_on_change
+        self.running_step_index: Optional[int] = None
         self.observer = None
+        self.event_handler = None
         self.should_restart = False
 
     def compose(self) -> ComposeResult:
@@ -164,6 +348,7 @@ class ReleaseApp(App):
             )
             yield RightPanel(
                 self.config.steps[self.current_step_index],
+                self.variables,
                 classes="right-panel",
                 id="right-panel",
             )
@@ -172,47 +357,239 @@ class ReleaseApp(App):
 
     def action_move_up(self) -> None:
         if self.current_step_index > 0:
-            self.current_step_index -= 1
-            self.update_current_step()
-            # Update ListView selection after a refresh to ensure proper synchronization
-            self.call_after_refresh(self._sync_listview_selection)
+            self._select_step(self.current_step_index - 1)
 
     def action_move_down(self) -> None:
         if self.current_step_index < len(self.config.steps) - 1:
-            self.current_step_index += 1
-            self.update_current_step()
-            # Update ListView selection after a refresh to ensure proper synchronization
-            self.call_after_refresh(self._sync_listview_selection)
+            self._select_step(self.current_step_index + 1)
 
-    def _sync_listview_selection(self) -> None:
-        """Synchronize the ListView selection with current_step_index"""
+    def _select_step(self, step_index: int) -> None:
+        """Highlight the step in the list, which updates the panels through the
+        StepSelected message.
+        """
         steps_list = self.query_one(StepsList)
-        steps_list.index = self.current_step_index
+        steps_list.highlighted = step_index
 
     def update_current_step(self) -> None:
+        with profiling.span("tui.update_step", index=self.current_step_index):
+            self._update_current_step()
+
+    def _update_current_step(self) -> None:
         # Update the left panel progress
         left_panel = self.query_one(".left-panel", LeftPanel)
         left_panel.update_progress(self.current_step_index)
 
         # Update the right panel description
         right_panel = self.query_one("#right-panel", RightPanel)
-        right_panel.update_description(self.config.steps[self.current_step_index])
+        right_panel.update_description(
+            self.config.steps[self.current_step_index], self.variables
+        )
+        right_panel.update_status(self.step_statuses.get(self.current_step_index, ""))
+        right_panel.show_output(self.step_outputs.get(self.current_step_index, []))
 
     def on_steps_list_step_selected(self, message: StepsList.StepSelected) -> None:
         """Handle step selection from the steps list"""
         self.current_step_index = message.step_index
         self.update_current_step()
 
+    def action_run_step(self) -> None:
+        if self.running_step_index is not None:
+            self.notify("A step is already running", severity="warning")
+            return
+        step_index = self.current_step_index
+        step = self.config.steps[step_index]
+        if not step.has_action:
+            self.notify("The step has no action to run")
+            return
+        self.running_step_index = step_index
+        self.step_outputs[step_index] = []
+        self._set_status(step_index, "Running...")
+        self.update_current_step()
+        self.run_worker(self._execute_step(step_index, step), group="step")
+
+    def action_cancel_step(self) -> None:
+        self.workers.cancel_group(self, "step")
+
+    async def _execute_step(self, step_index: int, step) -> None:
+        """Run the action of the step without blocking the UI. Actions which can't
+        be awaited run in a thread, and are cancelled at their next progress event.
+        """
+        cancelled = threading.Event()
+
+        def check_cancelled():
+            if cancelled.is_set():
+                raise StepCancelled
+
+        def echo(line: str):
+            check_cancelled()
+            self.post_message(self.StepOutput(step_index, line))
+
+        def on_progress(commits: int):
+            check_cancelled()
+            self.post_message(self.StepProgress(step_index, commits))
+
+        # the step gets a copy, the variables can change while it's running
+        variables = dict(self.variables)
+        if self.journal_pending:
+            self.journal.begin(self.variables)
+            self.journal_pending = False
+        self.journal.start(step_index, step)
+        try:
+            with profiling.span("step", number=step_index + 1, title=step.title):
+                # run_action also opens the URL of the step after the command
+                if (
+                    step.run
+                    and not step.run.session
+                    and not step.cache
+                    and not step.environments
+                    and not step.open_url
+                ):
+                    if step.run.command:
+                        echo("$ " + render_preview(step.run.command, variables))
+                    result = await runner.run_async(
+                        step.run, variables, lambda stream, line: echo(line)
+                    )
+                    output = runner.get_output(result)
+                else:
+                    output = await self._run_in_thread(
+                        step_index,
+                        cancelled,
+                        run_action,
+                        step,
+                        variables,
+                        echo,
+                        on_progress,
+                    )
+        except (asyncio.CancelledError, StepCancelled):
+            cancelled.set()
+            self._finish_step(step_index, "Cancelled")
+            raise
+        except Exception as e:
+            self._finish_step(step_index, f"Failed: {e}")
+            return
+
+        self.journal.finish(step_index, step, output)
+        if step.set_variable:
+            self.variables[step.set_variable] = output
+        self._finish_step(step_index, "Finished")
+        if self.is_release_finished():
+            self.journal.complete()
+
+    async def _run_in_thread(
+        self, step_index: int, cancelled: threading.Event, func, *args
+    ):
+        """Run func in a thread. On cancellation, the thread is told to stop and
+        waited for, so the step stays running until its action exited, and no
+        other step can start while it's still going in the background.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            self._set_status(step_index, "Cancelling...")
+            while not future.done():
+                try:
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    # cancelled again, the thread still has to exit first
+                    pass
+            if future.exception() is None:
+                # finished before it saw the cancellation
+                return future.result()
+            raise
+
+    def is_release_finished(self) -> bool:
+        """Every step with an action finished, in this run or the resumed one."""
+        finished = ("Finished", "Finished in a previous run")
+        return all(
+            self.step_statuses.get(i) in finished
+            for i, step in enumerate(self.config.steps)
+            if step.has_action
+        )
+
+    def _finish_step(self, step_index: int, status: str) -> None:
+        self.running_step_index = None
+        self._set_status(step_index, status)
+        # the descriptions might use the variable the step has set
+        self.update_current_step()
+
+    def _set_status(self, step_index: int, status: str) -> None:
+        self.step_statuses[step_index] = status
+        if step_index == self.current_step_index:
+            self.query_one("#right-panel", RightPanel).update_status(status)
+
+    def on_release_app_step_output(self, message: StepOutput) -> None:
+        self.step_outputs.setdefault(message.step_index, []).append(message.line)
+        if message.step_index == self.current_step_index:
+            self.query_one("#right-panel", RightPanel).write_output(message.line)
+
+    def on_release_app_step_progress(self, message: StepProgress) -> None:
+        if message.step_index == self.running_step_index:
+            status = f"Running... {message.commits} commits walked"
+            self._set_status(message.step_index, status)
+
     def restart_app(self):
         """Callback to restart the app when files change"""
         self.should_restart = True
         self.exit()
 
+    def on_files_changed(self, changed_paths):
+        """Called from the watcher thread with the changed files. Code changes need
+        a restart, but the release file is reloaded in place.
+        """
+        if changed_paths - {self.config_path.resolve()}:
+            self.call_from_thread(self.restart_app)
+        else:
+            self.call_from_thread(self.reload_config)
+
+    def reload_config(self):
+        """Load the release file again and update only the steps which changed.
+        The current config is kept when the new one is invalid.
+        """
+        with profiling.span("tui.reload"):
+            self._reload_config()
+
+    def _reload_config(self):
+        try:
+            config = load_release_config(self.config_path)
+        except (OSError, yaml.YAMLError, ValidationError) as e:
+            self.notify(str(e), title="Invalid release file", severity="error")
+            return
+        if not config.steps:
+            self.notify("The release file has no steps", severity="error")
+            return
+
+        # initial variables which changed in the file override the current values,
+        # but the variables set by steps are kept. The version is made from the
+        # current time, so it's only updated when its format changed.
+        old_initial = parse_initial_variables(self.config, os.environ)
+        new_initial = parse_initial_variables(config, os.environ)
+        if config.version == self.config.version:
+            del new_initial["version"]
+        for name, value in new_initial.items():
+            if old_initial.get(name) != value:
+                self.variables[name] = value
+
+        self.config = config
+        steps_list = self.query_one(StepsList)
+        with self.batch_update():
+            left_panel = self.query_one(".left-panel", LeftPanel)
+            self.current_step_index = min(
+                self.current_step_index, len(config.steps) - 1
+            )
+            left_panel.update_steps(config.steps, self.current_step_index)
+            if steps_list.highlighted != self.current_step_index:
+                steps_list.highlighted = self.current_step_index
+            self.update_current_step()
+
     def get_state(self):
         """Return current app state for persistence across restarts"""
         return {
             "current_step_index": self.current_step_index,
             "variables": self.variables,
+            "step_statuses": self.step_statuses,
+            "journal_pending": self.journal_pending,
         }
 
     def on_mount(self) -> None:
@@ -221,17 +598,27 @@ class ReleaseApp(App):
             self.setup_file_watcher()
 
     def setup_file_watcher(self):
-        """Set up the file watcher for Python and CSS files in the release package"""
-        release_package_path = Path(__file__).parent
+        """Set up the file watcher for Python and CSS files in the release package
+        and for the release file
+        """
+        release_package_path = Path(__file__).parent.resolve()
+        release_file = self.config_path.resolve()
 
         self.observer = Observer()
-        event_handler = TUIFileHandler(self.restart_app)
-        self.observer.schedule(event_handler, str(release_package_path), recursive=True)
+        self.event_handler = TUIFileHandler(
+            self.on_files_changed, release_package_path, release_file
+        )
+        self.observer.schedule(
+            self.event_handler, str(release_package_path), recursive=True
+        )
+        self.observer.schedule(self.event_handler, str(release_file.parent))
         self.observer.start()
 
     def on_unmount(self) -> None:
         """Clean up file watcher when app exits"""
+        self.journal.close()
         if self.observer:
+            self.event_handler.cancel()
             self.observer.stop()
             self.observer.join()
 
@@ -1,3 +1,6 @@
 from typing import Dict
 
-Variables = Dict[str, str]
+from .values import Value
+
+# outputs of steps can be values.FileValue too, which templates render with str()
+Variables = Dict[str, Value]
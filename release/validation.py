@@ -0,0 +1,148 @@
+"""Validation of release files: the pydantic models, and a static pass checking
+that the variables used by the templates are defined before the step using them.
+"""
+
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import yaml
+from pydantic import ValidationError
+
+from .config import ReleaseConfig, load_release_config
+from .parser import EnvTemplate, get_identifiers
+
+
+@dataclass
+class Problem:
+    # "undefined" or "shadowed"
+    kind: str
+    # "error" when the release fails or renders wrong, "warning" when it might
+    severity: str
+    name: str
+    message: str
+    # 1-based number of the step, None for the variables section
+    step: Optional[int] = None
+    title: Optional[str] = None
+
+
+def analyze(config: ReleaseConfig) -> List[Problem]:
+    """Go through the variables and steps in order, and report the names used
+    before any variable or step defines them, and the steps overwriting a
+    variable which is already defined.
+    """
+    problems = []
+    # name -> where it's defined, None for the variables section
+    defined: Dict[str, Optional[int]] = {"version": None}
+    setters = {
+        step.set_variable: stepnum
+        for stepnum, step in enumerate(config.steps, start=1)
+        if step.set_variable
+    }
+
+    for name, value in config.variables.items():
+        for used in sorted(get_identifiers(value, EnvTemplate)):
+            if used.startswith("env.") or used in defined:
+                continue
+            message = f"variable {name!r} uses {used!r}, which is not defined before it"
+            problems.append(Problem("undefined", "error", used, message))
+        defined[name] = None
+
+    for stepnum, step in enumerate(config.steps, start=1):
+        # in commands, unknown names are left for the shell, like $HOME
+        shell_templates = {step.run.command, step.run.script} if step.run else set()
+        # the title and description are only displayed, a name undefined there
+        # is a warning; they are checked last so a name also used by the action
+        # is reported as an error
+        templates = sorted(
+            step.iter_tagged_templates(), key=lambda item: item[0] == "display"
+        )
+        # names defined by the environments are only known by this step
+        known = set(defined)
+        if step.environments:
+            known.add("environment")
+            for env in step.environments:
+                known.update(env.variables)
+        reported: Set[str] = set()
+        for kind, text in templates:
+            for used in sorted(get_identifiers(text) - known - reported):
+                reported.add(used)
+                later = setters.get(used)
+                if later is not None:
+                    message = f"{used!r} is only set later, by step {later}"
+                else:
+                    message = f"{used!r} is not defined"
+                if text in shell_templates and later is None:
+                    severity = "warning"
+                    message += ", it's left for the shell"
+                elif kind == "display":
+                    severity = "warning"
+                else:
+                    severity = "error"
+                problems.append(
+                    Problem("undefined", severity, used, message, stepnum, step.title)
+                )
+
+        name = step.set_variable
+        if name:
+            if name in defined:
+                where = defined[name]
+                origin = "the variables" if where is None else f"step {where}"
+                message = f"sets {name!r}, which is already defined by {origin}"
+                problems.append(
+                    Problem("shadowed", "warning", name, message, stepnum, step.title)
+                )
+            defined[name] = stepnum
+
+    return problems
+
+
+def validate_file(path: Path, timings: Optional[Dict[str, float]] = None) -> dict:
+    """Validation result of one release file, as a JSON serializable dict."""
+    result = {"path": str(path), "valid": False, "errors": [], "problems": []}
+    try:
+        config = load_release_config(path, timings)
+    except OSError as e:
+        result["errors"].append({"loc": [], "message": e.strerror or str(e)})
+        return result
+    except yaml.YAMLError as e:
+        result["errors"].append({"loc": [], "message": str(e)})
+        return result
+    except ValidationError as e:
+        result["errors"] = [
+            {"loc": list(error["loc"]), "message": error["msg"]} for error in e.errors()
+        ]
+        return result
+
+    problems = analyze(config)
+    result["problems"] = [asdict(problem) for problem in problems]
+    result["valid"] = not any(problem.severity == "error" for problem in problems)
+    return result
+
+
+def expand_paths(patterns: Iterable[str]) -> List[Path]:
+    """Paths matching the glob patterns in sorted order, and the patterns which
+    are not globs as they are, so missing files are reported.
+    """
+    paths = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.update(Path(p) for p in glob.glob(pattern, recursive=True))
+        else:
+            paths.add(Path(pattern))
+    return sorted(paths)
+
+
+def validate_files(paths: List[Path], jobs: Optional[int] = None) -> List[dict]:
+    """Validate the files on a process pool, results in the order of paths."""
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    if jobs <= 1:
+        return [validate_file(path) for path in paths]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(jobs, mp_context=context) as executor:
+        chunksize = max(1, len(paths) // (jobs * 4))
+        return list(executor.map(validate_file, paths, chunksize=chunksize))
@@ -0,0 +1,166 @@
+"""Variable values which are too big to keep in memory as strings.
+
+A large step output is stored as a FileValue: a UTF-8 file the value is read
+from only when a template inlines it, which calls str() on it. Copies of the
+variables share the file, display code shows a preview of its beginning, and
+run steps stream it to the standard input of the process.
+"""
+
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+from typing import BinaryIO, Iterator, Mapping, Optional, Set, Union
+
+# outputs bigger than this many bytes in UTF-8 are stored in a file
+FILE_VALUE_MIN_SIZE = 1024 * 1024
+PREVIEW_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+
+def format_size(size: int) -> str:
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024:
+            return f"{size} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class FileValue:
+    """A variable value stored in a file. The file is deleted when the last
+    reference to an owned value is gone.
+    """
+
+    def __init__(self, path: Path, owned: bool = True):
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        self.owned = owned
+        if owned:
+            weakref.finalize(self, _unlink, self.path)
+
+    @classmethod
+    def from_text(cls, text: str) -> "FileValue":
+        fd, path = tempfile.mkstemp(prefix="release-", suffix=".value")
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return cls(Path(path))
+
+    @classmethod
+    def copy_of(cls, source: Path) -> "FileValue":
+        """An owned copy of the file, which stays valid when the source is removed."""
+        fd, path = tempfile.mkstemp(prefix="release-", suffix=".value")
+        with os.fdopen(fd, "wb") as dest, source.open("rb") as f:
+            shutil.copyfileobj(f, dest, CHUNK_SIZE)
+        return cls(Path(path))
+
+    def __str__(self) -> str:
+        # without newline translation, \r and \r\n are kept as they are
+        with self.path.open(encoding="utf-8", newline="") as f:
+            return f.read()
+
+    def __repr__(self) -> str:
+        return f"FileValue({str(self.path)!r}, {format_size(self.size)})"
+
+    def __reduce__(self):
+        # sent to worker processes as the path, the sender keeps the file
+        return FileValue, (self.path, False)
+
+    def head(self, max_chars: int) -> str:
+        """The first max_chars characters, without reading the rest of the file."""
+        if not self.size:
+            return ""
+        with (
+            self.path.open("rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data,
+        ):
+            # a character is at most 4 bytes, a cut one is dropped
+            text = data[: max_chars * 4].decode("utf-8", errors="ignore")
+        return text[:max_chars]
+
+    def preview(self, max_chars: int = PREVIEW_SIZE) -> str:
+        text = self.head(max_chars)
+        shown = len(text.encode())
+        if shown < self.size:
+            text += f"\n… ({format_size(self.size - shown)} more)"
+        return text
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        with self.path.open("rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+    def copy_to(self, dest: BinaryIO):
+        with self.path.open("rb") as f:
+            shutil.copyfileobj(f, dest, CHUNK_SIZE)
+
+    def digest(self) -> str:
+        sha256 = hashlib.sha256()
+        for chunk in self.iter_chunks():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+
+def _unlink(path: Path):
+    path.unlink(missing_ok=True)
+
+
+Value = Union[str, FileValue]
+
+
+def to_value(output: Value) -> Value:
+    """Large outputs as FileValue, so they are not kept in memory."""
+    if isinstance(output, str) and is_large(output):
+        return FileValue.from_text(output)
+    return output
+
+
+def is_large(text: str) -> bool:
+    # a character is at least 1 byte, only encode when it can be close
+    return len(text) > FILE_VALUE_MIN_SIZE or (
+        len(text) * 4 > FILE_VALUE_MIN_SIZE and len(text.encode()) > FILE_VALUE_MIN_SIZE
+    )
+
+
+def get_digest(value: Value) -> str:
+    """Hash of the value, for cache keys."""
+    if isinstance(value, FileValue):
+        return value.digest()
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def inline_values(
+    variables: Mapping[str, Value], names: Optional[Set[str]] = None
+) -> dict:
+    """Copy of the variables with the file values in names (every one when it's
+    None) read into strings.
+    """
+    return {
+        name: str(value)
+        if isinstance(value, FileValue) and (names is None or name in names)
+        else value
+        for name, value in variables.items()
+    }
+
+
+class PreviewView(Mapping[str, str]):
+    """The variables with previews of the file values, for rendering templates
+    which are only displayed.
+    """
+
+    def __init__(self, variables: Mapping[str, Value]):
+        self._variables = variables
+
+    def __getitem__(self, key: str) -> str:
+        value = self._variables[key]
+        if isinstance(value, FileValue):
+            return value.preview()
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._variables)
+
+    def __len__(self) -> int:
+        return len(self._variables)
@@ -0,0 +1,49 @@
+from release.config import ReleaseConfig, Step, get_model_modules
+
+
+def test_model_modules():
+    assert get_model_modules() == [
+        "release.config",
+        "release.git.config",
+        "release.gitlab.config",
+        "release.python.config",
+        "release.runner.config",
+    ]
+
+
+def test_open_url_with_action():
+    config = ReleaseConfig.parse_obj(
+        {
+            "version": {"from_time": "%Y"},
+            "variables": {},
+            "steps": [
+                {
+                    "title": "Deploy",
+                    "run": {"command": "true"},
+                    "open_url": "https://example.com",
+                },
+                {"title": "Open", "open_url": "https://example.com"},
+            ],
+        }
+    )
+    assert config.steps[0].action == "run"
+    assert config.steps[1].action is None
+    assert config.steps[1].has_action
+
+
+def test_tagged_templates():
+    step = Step(
+        title="Deploy $version",
+        run={"command": "deploy $version"},
+        open_url="https://example.com/$version",
+        environments=[{"name": "eu", "variables": {"host": "eu.$domain"}}],
+    )
+    assert list(step.iter_tagged_templates()) == [
+        ("display", "Deploy $version"),
+        ("action", "deploy $version"),
+        ("action", "https://example.com/$version"),
+        ("action", "eu.$domain"),
+    ]
+    assert list(step.iter_templates()) == [
+        text for _, text in step.iter_tagged_templates()
+    ]
@@ -0,0 +1,128 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pygit2 as pg2
+import pytest
+
+from release.git import pool
+from release.git.client import Repo
+from release.git.config import GitConfig
+from release.git.run import get_repo_paths, get_repo_state, get_worktree_state
+from release.git.tags import get_signature
+
+
+def build_history(path: Path):
+    """main:   A - C -- M1 - D - M2
+                \\     /        /
+    x:           X1 -- X2      /
+                       \\     /
+    y:                  Y1 (forked from M1)
+    """
+    repo = pg2.init_repository(str(path))
+    tree = repo.TreeBuilder().write()
+    time = 1_700_000_000
+
+    def commit(message, parents):
+        nonlocal time
+        time += 60
+        signature = pg2.Signature("Test", "test@example.com", time, 0)
+        return repo.create_commit(None, signature, signature, message, tree, parents)
+
+    a = commit("A", [])
+    x1 = commit("X1", [a])
+    c = commit("C", [a])
+    m1 = commit("Merge x", [c, x1])
+    x2 = commit("X2", [x1])
+    y1 = commit("Y1", [m1])
+    d = commit("D", [m1])
+    m2 = commit("Merge y", [d, y1])
+    repo.references.create("refs/heads/main", m2, force=True)
+    repo.references.create("refs/heads/x", x2)
+    repo.set_head("refs/heads/main")
+    return {"m1": m1, "m2": m2}
+
+
+@pytest.mark.parametrize("commit_graph", [False, True])
+def test_latest_merge_of_branch(tmp_path, commit_graph):
+    commits = build_history(tmp_path)
+    if commit_graph:
+        subprocess.run(
+            ["git", "commit-graph", "write", "--reachable"], cwd=tmp_path, check=True
+        )
+    repo = Repo(tmp_path)
+    assert (repo.get_commit_graph() is not None) == commit_graph
+    assert repo.find_latest_merge("x") == commits["m1"]
+    assert repo.find_latest_merge() == commits["m2"]
+
+
+def test_signature_changes_with_nested_tags(tmp_path):
+    commits = build_history(tmp_path / "repo")
+    repo = pg2.Repository(str(tmp_path / "repo"))
+    signature = get_signature(Path(repo.path))
+    repo.references.create("refs/tags/release/1.0", commits["m1"])
+    nested = get_signature(Path(repo.path))
+    assert nested != signature
+
+    # the tags of a worktree are in the common directory of the repository
+    subprocess.run(
+        ["git", "worktree", "add", "-q", str(tmp_path / "worktree"), "x"],
+        cwd=tmp_path / "repo",
+        check=True,
+    )
+    worktree = pg2.Repository(str(tmp_path / "worktree"))
+    assert get_signature(Path(worktree.path)) == get_signature(Path(repo.path))
+    repo.references.create("refs/tags/release/2.0", commits["m2"])
+    assert get_signature(Path(worktree.path)) != nested
+
+
+def test_latest_tag_of_commit_by_version(tmp_path):
+    commits = build_history(tmp_path)
+    repo = pg2.Repository(str(tmp_path))
+    for name in ("v1.9", "v1.10", "v1.2"):
+        repo.references.create(f"refs/tags/{name}", commits["m2"])
+    assert Repo(tmp_path).get_latest_tag().name == "refs/tags/v1.10"
+
+
+def test_repo_pattern_matching_nothing(tmp_path):
+    config = GitConfig.parse_obj(
+        {
+            "repo": [str(tmp_path / "repo"), f"{tmp_path}/other-*"],
+            "get_shortlog": {"include_merge_commits": False, "since": "LATEST_TAG"},
+        }
+    )
+    with pytest.raises(ValueError, match="other-\\*"):
+        get_repo_paths(config, {})
+    (tmp_path / "other-1").mkdir()
+    assert get_repo_paths(config, {}) == [tmp_path / "repo", tmp_path / "other-1"]
+
+
+def test_shared_repo_from_threads(tmp_path):
+    commits = build_history(tmp_path)
+    pg2.Repository(str(tmp_path)).references.create("refs/tags/v1", commits["m1"])
+    subprocess.run(
+        ["git", "commit-graph", "write", "--reachable"], cwd=tmp_path, check=True
+    )
+    repo = Repo(tmp_path)
+    with ThreadPoolExecutor(8) as executor:
+        futures = [
+            executor.submit(
+                lambda: (repo.get_latest_tag().name, repo.find_latest_merge("x"))
+            )
+            for _ in range(32)
+        ]
+        results = {future.result() for future in futures}
+    assert results == {("refs/tags/v1", commits["m1"])}
+    repo.close()
+
+
+def test_states_use_the_pooled_repo(tmp_path):
+    build_history(tmp_path)
+    (tmp_path / "sub").mkdir()
+    before = get_worktree_state(tmp_path / "sub")
+    assert get_repo_state(tmp_path / "sub") is not None
+    (tmp_path / "sub" / "new.txt").write_text("new")
+    assert get_worktree_state(tmp_path) != before
+    # the same Repo the steps get for the repository
+    opened = [path for path in pool._repos if tmp_path.resolve() in path.parents]
+    assert opened == [] and tmp_path.resolve() in pool._repos
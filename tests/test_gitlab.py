@@ -0,0 +1,185 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from release.cache import DiskCache
+from release.gitlab.client import GitlabError, Session
+from release.gitlab.config import ReleaseOperation
+from release.gitlab.run import create_release
+
+
+class StubServer:
+    """Local GitLab API answering with the responses queued by the tests, and
+    recording the requests.
+    """
+
+    def __init__(self):
+        # (method, path) -> list of (status, headers, body), the last one repeats
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_one(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                stub.requests.append((self.command, self.path, self.headers, body))
+                path = self.path.split("?")[0]
+                responses = stub.routes.get((self.command, path))
+                if not responses:
+                    status, headers, data = 404, {}, {"message": "404 Not Found"}
+                elif len(responses) > 1:
+                    status, headers, data = responses.pop(0)
+                else:
+                    status, headers, data = responses[0]
+                payload = b"" if data is None else json.dumps(data).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = handle_one
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.01}
+        )
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr("release.gitlab.client.BACKOFF_BASE", 0)
+    stub = StubServer()
+    yield stub
+    stub.close()
+
+
+def get_session(server: StubServer, cache=None) -> Session:
+    return Session(server.url, "token", pool_size=2, retries=3, cache=cache)
+
+
+def test_paginate(server):
+    path = "/api/v4/projects/1/items"
+    next_link = f'<{server.url}{path}?page=2&per_page=100>; rel="next"'
+    server.routes[("GET", path)] = [
+        (200, {"Link": next_link}, [1, 2]),
+        (200, {}, [3]),
+    ]
+    session = get_session(server)
+    assert list(session.paginate("/projects/1/items")) == [1, 2, 3]
+    assert [request[1] for request in server.requests] == [
+        f"{path}?per_page=100",
+        f"{path}?page=2&per_page=100",
+    ]
+
+
+def test_paginate_stops_early(server):
+    path = "/api/v4/projects/1/items"
+    next_link = f'<{server.url}{path}?page=2>; rel="next"'
+    server.routes[("GET", path)] = [(200, {"Link": next_link}, [1, 2])]
+    assert next(get_session(server).paginate("/projects/1/items")) == 1
+    assert len(server.requests) == 1
+
+
+def test_retry_on_server_errors(server):
+    server.routes[("GET", "/api/v4/version")] = [
+        (503, {}, None),
+        (429, {"Retry-After": "0"}, None),
+        (200, {}, {"version": "17.0"}),
+    ]
+    assert get_session(server).get("/version") == {"version": "17.0"}
+    assert len(server.requests) == 3
+
+
+def test_retries_run_out(server):
+    server.routes[("GET", "/api/v4/version")] = [(502, {}, None)]
+    with pytest.raises(GitlabError) as excinfo:
+        get_session(server).get("/version")
+    assert excinfo.value.status == 502
+    # the first request and 3 retries
+    assert len(server.requests) == 4
+
+
+def test_post_is_not_retried_on_bad_gateway(server):
+    server.routes[("POST", "/api/v4/projects/1/repository/tags")] = [
+        (502, {}, None),
+        (201, {}, {}),
+    ]
+    with pytest.raises(GitlabError):
+        get_session(server).post("/projects/1/repository/tags", {"tag_name": "v1"})
+    assert len(server.requests) == 1
+
+
+def test_etag_cache(server, tmp_path):
+    server.routes[("GET", "/api/v4/projects/1")] = [
+        (200, {"ETag": '"abc"'}, {"id": 1}),
+        (304, {"ETag": '"abc"'}, None),
+    ]
+    session = get_session(server, DiskCache(tmp_path / "cache"))
+    assert session.get("/projects/1") == {"id": 1}
+    assert session.get("/projects/1") == {"id": 1}
+    first, second = server.requests
+    assert "If-None-Match" not in first[2]
+    assert second[2]["If-None-Match"] == '"abc"'
+
+
+def test_existing_release_is_updated(server):
+    releases = "/api/v4/projects/group%2Fapp/releases"
+    release = {"_links": {"self": "https://gitlab.example.com/release"}}
+    server.routes[("POST", releases)] = [(409, {}, {"message": "exists"})]
+    server.routes[("PUT", f"{releases}/v1.0")] = [(200, {}, release)]
+    server.routes[("POST", f"{releases}/v1.0/assets/links")] = [(201, {}, {})]
+    op = ReleaseOperation.parse_obj(
+        {
+            "tag_name": "v$version",
+            "description": "Notes",
+            "assets": [{"name": "docs", "url": "https://example.com/docs"}],
+        }
+    )
+    lines = []
+    url = create_release(
+        get_session(server),
+        "group/app",
+        op,
+        {"version": "1.0"},
+        lines.append,
+        threading.Event(),
+    )
+    assert url == "https://gitlab.example.com/release"
+    assert lines == ["group/app: release v1.0 exists, updating it"]
+    methods = [(method, path) for method, path, _, _ in server.requests]
+    assert methods == [
+        ("POST", releases),
+        ("PUT", f"{releases}/v1.0"),
+        ("POST", f"{releases}/v1.0/assets/links"),
+    ]
+    update = json.loads(server.requests[1][3])
+    assert update == {"tag_name": "v1.0", "name": "v1.0", "description": "Notes"}
+    link = json.loads(server.requests[2][3])
+    assert link == {"name": "docs", "url": "https://example.com/docs"}
+
+
+def test_upload_streams_file(server, tmp_path):
+    path = tmp_path / "app.tar.gz"
+    path.write_bytes(b"x" * 100_000)
+    upload = "/api/v4/projects/1/packages/generic/release-assets/v1/app.tar.gz"
+    server.routes[("PUT", upload)] = [(201, {}, {})]
+    get_session(server).request("PUT", upload, body=Path(path))
+    assert server.requests[0][3] == path.read_bytes()
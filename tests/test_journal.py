@@ -0,0 +1,124 @@
+import asyncio
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from release.cli import main
+from release.config import load_release_config
+from release.journal import Journal, get_journal_path
+from release.tui import ReleaseApp
+
+RELEASE_FILE = """\
+version: {from_time: "%Y.%m.%d.%H%M%S%f"}
+variables: {}
+steps:
+  - title: First
+    run: {command: "echo first >> log; printf first"}
+    set_variable: first
+  - title: Second
+    run: {command: cat fail 2>/dev/null && echo second $first >> log}
+"""
+
+
+def write_release_file(tmp_path: Path) -> Path:
+    path = tmp_path / "release.yaml"
+    path.write_text(
+        RELEASE_FILE.replace("log", str(tmp_path / "log")).replace(
+            "cat fail", f"cat {tmp_path / 'fail'}"
+        )
+    )
+    (tmp_path / "fail").write_text("")
+    return path
+
+
+def start(path: Path, *args: str):
+    return CliRunner().invoke(
+        main, ["-f", str(path), "start", "--non-interactive", *args]
+    )
+
+
+def test_replay_finished_steps(tmp_path):
+    path = write_release_file(tmp_path)
+    steps = load_release_config(path).steps
+    journal = Journal(get_journal_path(path))
+    journal.begin({"version": "1"})
+    journal.start(0, steps[0])
+    journal.finish(0, steps[0], "output")
+    journal.start(1, steps[1])
+    journal.close()
+
+    state = Journal(get_journal_path(path)).replay()
+    assert state.variables == {"version": "1"}
+    assert state.get_completed(steps) == {0: "output"}
+
+
+def test_completed_run_is_not_resumed(tmp_path):
+    path = write_release_file(tmp_path)
+    journal = Journal(get_journal_path(path))
+    journal.begin({"version": "1"})
+    journal.complete()
+    journal.close()
+
+    state = Journal(get_journal_path(path)).replay()
+    assert state.variables is None
+    assert state.finished == {}
+
+
+def test_resume_skips_finished_steps(tmp_path):
+    path = write_release_file(tmp_path)
+    (tmp_path / "fail").unlink()
+    assert start(path).exit_code == 1
+    (tmp_path / "fail").write_text("")
+
+    result = start(path, "--resume")
+    assert result.exit_code == 0, result.output
+    assert "Finished in a previous run" in result.output
+    assert (tmp_path / "log").read_text() == "first\nsecond first\n"
+
+    # the finished run starts over
+    result = start(path, "--resume")
+    assert "No previous run to resume" in result.output
+    assert (
+        tmp_path / "log"
+    ).read_text() == "first\nsecond first\nfirst\nsecond first\n"
+
+
+def test_tui_replays_only_with_resume(tmp_path):
+    path = write_release_file(tmp_path)
+    (tmp_path / "fail").unlink()
+    start(path)
+
+    resumed = ReleaseApp(config_path=path, resume=True)
+    assert resumed.step_statuses == {0: "Finished in a previous run"}
+    version = resumed.variables["version"]
+    resumed.journal.close()
+
+    fresh = ReleaseApp(config_path=path)
+    assert fresh.step_statuses == {}
+    assert fresh.variables["version"] != version
+    fresh.journal.close()
+
+
+def test_tui_keeps_interrupted_journal_until_a_step_runs(tmp_path):
+    path = write_release_file(tmp_path)
+    (tmp_path / "fail").unlink()
+    start(path)
+    version = Journal(get_journal_path(path)).replay().variables["version"]
+
+    ReleaseApp(config_path=path).journal.close()
+    assert Journal(get_journal_path(path)).replay().variables["version"] == version
+
+    app = ReleaseApp(config_path=path)
+
+    async def run_first_step():
+        async with app.run_test() as pilot:
+            await pilot.press("r")
+            for _ in range(50):
+                if app.step_statuses.get(0) == "Finished":
+                    break
+                await pilot.pause(0.05)
+
+    asyncio.run(run_first_step())
+    state = Journal(get_journal_path(path)).replay()
+    assert state.variables["version"] == app.variables["version"] != version
+    assert list(state.finished) == [0]
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from release.matrix import MatrixInstance, load_matrix_file, run_matrix
+
+RELEASE_FILE = """\
+version: {from_time: "%Y"}
+variables: {}
+steps:
+  - title: Where
+    run:
+      command: pwd > where
+"""
+
+
+@pytest.fixture
+def release_file(tmp_path, monkeypatch):
+    # the instances run python -m release from their own directory
+    package_dir = Path(__file__).parent.parent
+    monkeypatch.setenv("PYTHONPATH", str(package_dir))
+    path = tmp_path / "release.yaml"
+    path.write_text(RELEASE_FILE)
+    return path
+
+
+def test_dirs_are_relative_to_the_matrix_file(tmp_path, monkeypatch):
+    (tmp_path / "projects" / "app").mkdir(parents=True)
+    matrix_file = tmp_path / "projects" / "matrix.yaml"
+    matrix_file.write_text("- dir: app\n- {name: a}\n")
+    monkeypatch.chdir(tmp_path)
+    instances = load_matrix_file(matrix_file)
+    assert instances[0].dir == tmp_path / "projects" / "app"
+    assert instances[1].dir is None
+
+
+def test_missing_dir(tmp_path):
+    matrix_file = tmp_path / "matrix.yaml"
+    matrix_file.write_text("- dir: missing\n")
+    with pytest.raises(ValueError, match="directory of instance 1 doesn't exist"):
+        load_matrix_file(matrix_file)
+
+
+def test_instance_failing_to_start(tmp_path, release_file):
+    (tmp_path / "app").mkdir()
+    instances = [
+        MatrixInstance(dir=tmp_path / "removed"),
+        MatrixInstance(dir=tmp_path / "app"),
+    ]
+    results = run_matrix(instances, release_file, tmp_path / "logs", jobs=2)
+    assert [result.returncode for result in results] == [-1, 0]
+    assert "Couldn't start the instance" in results[0].log_path.read_text()
+    assert (tmp_path / "app" / "where").read_text() == f"{tmp_path / 'app'}\n"
@@ -0,0 +1,69 @@
+import os
+import pickle
+
+import pytest
+
+from release.cache import get_cache_dir
+from release.python import code
+from release.python.config import PythonConfig
+from release.python.run import run_step
+from release.values import FileValue
+
+
+@pytest.fixture(autouse=True)
+def clear_compiled(monkeypatch):
+    monkeypatch.setattr(code, "_compiled", {})
+
+
+def test_expression_and_statements():
+    assert run_step(PythonConfig(code="version + '.1'"), {"version": "2"}) == "2.1"
+    statements = "parts = version.split('.')\nresult = parts[0]"
+    assert run_step(PythonConfig(code=statements), {"version": "2.3"}) == "2"
+    assert run_step(PythonConfig(code="x = 1"), {}) == ""
+    assert run_step(PythonConfig(code="variables['a']"), {"a": "b"}) == "b"
+
+
+def test_compiled_code_is_cached_on_disk(monkeypatch):
+    source = "1 + 1"
+    mode, _ = code.get_compiled(source)
+    assert mode == "eval"
+    key = code.get_code_key(source)
+    assert (get_cache_dir("python") / f"{key}.marshal").exists()
+
+    def compile_again(source):
+        raise AssertionError("compiled again")
+
+    monkeypatch.setattr(code, "_compiled", {})
+    monkeypatch.setattr(code, "_compile", compile_again)
+    mode, compiled = code.get_compiled(source)
+    assert (mode, eval(compiled)) == ("eval", 2)
+
+
+def test_code_key_depends_on_python_version(monkeypatch):
+    key = code.get_code_key("1 + 1")
+    assert code.get_code_key("2 + 2") != key
+    monkeypatch.setattr(code, "MAGIC_NUMBER", b"\x00\x00\r\n")
+    assert code.get_code_key("1 + 1") != key
+
+
+def test_isolated_step_runs_in_worker_process():
+    config = PythonConfig(code="__import__('os').getpid()", isolated=True)
+    assert run_step(config, {}) != str(os.getpid())
+
+
+def test_file_value_sent_to_worker_process():
+    value = FileValue.from_text("large output")
+    # the worker gets the path, the sender keeps owning the file
+    copy = pickle.loads(pickle.dumps(value))
+    assert copy.path == value.path and not copy.owned
+    del copy
+    assert value.path.exists()
+
+    variables = {"big": value, "name": "release"}
+    unused = PythonConfig(code="name.upper()", isolated=True)
+    assert run_step(unused, variables) == "RELEASE"
+    assert value.path.exists()
+    used = PythonConfig(code="big.split()[0]", isolated=True)
+    assert run_step(used, variables) == "large"
+    path_of = PythonConfig(code="str(variables['big'])", isolated=True)
+    assert run_step(path_of, variables) == "large output"
@@ -0,0 +1,107 @@
+import json
+import threading
+
+import pytest
+
+from release.config import Environment, RolloutConfig, Step
+from release.rollout import RolloutError, get_stages, run_rollout
+
+
+def make_step(names, **rollout):
+    return Step(
+        title="Deploy",
+        environments=[
+            Environment(name=name, variables={"host": "${environment}.example.com"})
+            for name in names
+        ],
+        rollout=RolloutConfig(**rollout),
+    )
+
+
+def test_stages():
+    step = make_step(["a", "b", "c", "d", "e"], canary=1, batch_size=2)
+    stages = get_stages(step.environments, step.rollout)
+    assert [[env.name for env in stage] for stage in stages] == [
+        ["a"],
+        ["b", "c"],
+        ["d", "e"],
+    ]
+    step = make_step(["a", "b", "c"])
+    stages = get_stages(step.environments, step.rollout)
+    assert [[env.name for env in stage] for stage in stages] == [["a", "b", "c"]]
+
+
+def test_canary_runs_before_the_others():
+    step = make_step(["canary", "b", "c"], canary=1)
+    started = []
+    lock = threading.Lock()
+
+    def run(variables, echo):
+        with lock:
+            started.append(variables["environment"])
+        echo("deployed")
+        return variables["host"]
+
+    lines = []
+    outputs = json.loads(run_rollout(step, {"version": "1"}, run, lines.append))
+    assert started[0] == "canary"
+    assert outputs == {
+        "canary": "canary.example.com",
+        "b": "b.example.com",
+        "c": "c.example.com",
+    }
+    assert list(outputs) == ["canary", "b", "c"]
+    assert lines[0] == "Stage 1/2: canary"
+    assert "[b] deployed" in lines
+
+
+def test_batches_run_one_after_another():
+    step = make_step(["a", "b", "c", "d"], batch_size=2)
+    running = set()
+    batches = []
+    lock = threading.Lock()
+
+    def run(variables, echo):
+        with lock:
+            running.add(variables["environment"])
+            batches.append(set(running))
+        with lock:
+            running.discard(variables["environment"])
+        return ""
+
+    run_rollout(step, {}, run, lambda line: None)
+    # the second batch never overlaps the first
+    assert all(not ({"a", "b"} & s and {"c", "d"} & s) for s in batches)
+
+
+def test_failed_canary_stops_the_later_stages():
+    step = make_step(["canary", "b", "c", "d"], canary=1, batch_size=2)
+    started = []
+
+    def run(variables, echo):
+        started.append(variables["environment"])
+        raise RuntimeError("unhealthy")
+
+    lines = []
+    with pytest.raises(RolloutError) as e:
+        run_rollout(step, {}, run, lines.append)
+    assert started == ["canary"]
+    assert str(e.value) == "Failed in canary, skipped 3 environments"
+    assert "[canary] failed: unhealthy" in lines
+
+
+def test_failed_batch_counts_the_finished_environments():
+    step = make_step(["a", "b", "c", "d", "e"], batch_size=2, concurrency=2)
+
+    def run(variables, echo):
+        if variables["environment"] == "c":
+            raise RuntimeError("unhealthy")
+        return "ok"
+
+    lines = []
+    with pytest.raises(RolloutError) as e:
+        run_rollout(step, {}, run, lines.append)
+    # a and b succeeded, d ran in the failed batch, e was skipped
+    assert str(e.value) == "Failed in c, skipped 1 environments"
+    assert "[a] finished" in lines and "[d] finished" in lines
+    assert not any(line.startswith("[e]") for line in lines)
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from release.runner import run
+from release.runner.config import RunConfig
+from release.runner.output import MAX_LINE_SIZE, OutputBuffer, RunError
+from release.runner.run import ERROR_STDERR_SIZE, run_async
+from release.values import FileValue
+
+
+def test_error_shows_end_of_stderr(tmp_path):
+    command = "head -c 100000 /dev/zero | tr '\\0' x >&2; echo last >&2; exit 3"
+    with pytest.raises(RunError) as excinfo:
+        run(RunConfig(command=command, chdir=tmp_path), {})
+    message = str(excinfo.value)
+    assert message.startswith("Command failed with exit code 3:\n…")
+    assert message.endswith("xlast")
+    assert len(message) < ERROR_STDERR_SIZE + 100
+
+
+def test_output_without_newlines_is_bounded(tmp_path):
+    # a progress bar redrawn with \r, 1 MB without a newline
+    command = "for i in $(seq 1 20000); do printf '\\r%045d' $i; done"
+    config = RunConfig(command=command, chdir=tmp_path)
+    result = asyncio.run(run_async(config, {}, max_size=100_000))
+    try:
+        assert len(result.stdout.tail()) <= 100_000 + MAX_LINE_SIZE
+        value = result.stdout.getvalue()
+        assert len(value) == 20000 * 46
+        assert value.endswith("\r%045d" % 20000)
+    finally:
+        result.close()
+
+
+def test_non_ascii_output_is_read_back(tmp_path):
+    command = "for i in $(seq 1 3000); do echo 'árvíztűrő tükörfúrógép'; done"
+    config = RunConfig(command=command, chdir=tmp_path)
+    result = asyncio.run(run_async(config, {}, max_size=1000))
+    try:
+        assert result.stdout.getvalue() == "árvíztűrő tükörfúrógép\n" * 3000
+    finally:
+        result.close()
+
+
+def test_output_size_is_counted_in_bytes():
+    buffer = OutputBuffer(max_size=1000)
+    try:
+        # 600 characters, 1200 bytes
+        buffer.append("é" * 599 + "\n")
+        assert buffer.size == 1199
+        assert buffer.spill_path is not None
+        value = buffer.take_value()
+        assert isinstance(value, FileValue)
+        assert value.size == buffer.size
+    finally:
+        buffer.close()
@@ -0,0 +1,46 @@
+import pytest
+
+from release.config import Step
+from release.runner.output import RunError
+from release.scheduler import get_dependencies, run_steps_concurrently
+
+
+def test_session_steps_depend_on_the_previous_one():
+    steps = [
+        Step.parse_obj({"title": "cd", "run": {"command": "cd sub", "session": "a"}}),
+        Step.parse_obj({"title": "other", "run": {"command": "true", "session": "b"}}),
+        Step.parse_obj({"title": "pwd", "run": {"command": "pwd", "session": "a"}}),
+        Step.parse_obj({"title": "plain", "run": {"command": "pwd"}}),
+    ]
+    assert get_dependencies(steps) == [set(), set(), {0}, set()]
+
+
+def test_session_state_is_kept_when_running_concurrently(tmp_path):
+    (tmp_path / "sub").mkdir()
+    run = {"chdir": str(tmp_path), "session": "test"}
+    steps = [
+        Step.parse_obj({"title": "cd", "run": {**run, "command": "sleep 0.3; cd sub"}}),
+        Step.parse_obj(
+            {"title": "pwd", "run": {**run, "command": "pwd"}, "set_variable": "dir"}
+        ),
+    ]
+    variables = {}
+    run_steps_concurrently(steps, variables, jobs=4)
+    assert variables["dir"] == f"{tmp_path / 'sub'}\n"
+
+
+def test_output_of_failed_step_is_shown(tmp_path, capsys):
+    steps = [
+        Step.parse_obj(
+            {
+                "title": "Fails",
+                "run": {"command": "echo checking; echo broken >&2; exit 1"},
+            }
+        )
+    ]
+    with pytest.raises(RunError):
+        run_steps_concurrently(steps, {}, jobs=2)
+    output = capsys.readouterr().out
+    assert "Fails" in output
+    assert "checking" in output
+    assert "broken" in output
@@ -0,0 +1,25 @@
+import pytest
+
+from release.runner import run
+from release.runner.config import RunConfig
+from release.runner.output import RunError
+
+
+def test_session_script_stops_at_failure(tmp_path):
+    (tmp_path / "sub").mkdir()
+    run(RunConfig(command="cd sub", chdir=tmp_path, session="test"), {})
+    lines = []
+    script = RunConfig(
+        script="echo one\nfalse\necho two", chdir=tmp_path, session="test"
+    )
+    with pytest.raises(RunError, match="exit code 1"):
+        run(script, {}, lambda stream, line: lines.append(line))
+    assert lines == ["one"]
+
+    # the shell exited, the next step gets a new one without the earlier cd
+    pwd = RunConfig(command="pwd", chdir=tmp_path, session="test")
+    assert run(pwd, {}) == f"{tmp_path}\n"
+    export = RunConfig(script="export NAME=value", chdir=tmp_path, session="test")
+    run(export, {})
+    echo = RunConfig(command="false; echo $NAME", chdir=tmp_path, session="test")
+    assert run(echo, {}) == "value\n"
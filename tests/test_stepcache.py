@@ -0,0 +1,53 @@
+import pygit2 as pg2
+
+from release.cache import DiskCache
+from release.config import Step
+from release.stepcache import get_output, get_step_key, put_output
+from release.values import FILE_VALUE_MIN_SIZE, FileValue, to_value
+
+
+def test_python_step_reading_variables_dict():
+    step = Step.parse_obj(
+        {"title": "t", "python": {"code": "variables['x']"}, "cache": True}
+    )
+    assert get_step_key(step, {"x": "1"}) != get_step_key(step, {"x": "2"})
+
+
+def test_run_step_with_uncommitted_changes(tmp_path):
+    repo = pg2.init_repository(str(tmp_path))
+    (tmp_path / "file").write_text("one")
+    repo.index.add("file")
+    repo.index.write()
+    signature = pg2.Signature("Test", "test@example.com")
+    tree = repo.index.write_tree()
+    repo.create_commit("HEAD", signature, signature, "first", tree, [])
+
+    step = Step.parse_obj(
+        {
+            "title": "t",
+            "run": {"command": "cat file", "chdir": str(tmp_path)},
+            "cache": True,
+        }
+    )
+    clean = get_step_key(step, {})
+    assert get_step_key(step, {}) == clean
+    (tmp_path / "file").write_text("changed")
+    assert get_step_key(step, {}) != clean
+
+
+def test_large_output_is_cached_as_file(tmp_path):
+    cache = DiskCache(tmp_path / "cache")
+    output = to_value("é" * (FILE_VALUE_MIN_SIZE // 2 + 1))
+    assert isinstance(output, FileValue)
+    put_output(cache, "key", output)
+    assert cache.attachment_path("key").stat().st_size == output.size
+
+    cached = get_output(cache, "key")
+    assert isinstance(cached, FileValue)
+    assert cached.path != cache.attachment_path("key")
+    assert cached.digest() == output.digest()
+
+    cache.max_size = 0
+    cache.evict()
+    assert not cache.attachment_path("key").exists()
+    assert get_output(cache, "key") is None
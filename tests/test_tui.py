@@ -0,0 +1,103 @@
+import asyncio
+
+from watchdog.events import FileModifiedEvent
+
+from release.tui import ReleaseApp, TUIFileHandler
+
+
+def test_watches_only_package_code_and_release_file(tmp_path):
+    package = tmp_path / "release"
+    project = tmp_path / "project"
+    release_file = project / "release.yaml"
+    changes = []
+    handler = TUIFileHandler(changes.append, package, release_file, debounce=0)
+
+    assert handler.is_watched(package / "tui.py")
+    assert handler.is_watched(package / "tui.tcss")
+    assert handler.is_watched(release_file)
+    assert not handler.is_watched(project / "setup.py")
+    assert not handler.is_watched(project / "other.yaml")
+
+    handler.on_any_event(FileModifiedEvent(str(project / "app.py")))
+    handler.cancel()
+    assert changes == []
+
+
+def test_reload_keeps_time_based_version(tmp_path):
+    release_file = tmp_path / "release.yaml"
+    text = 'version: {from_time: "%H%M%S%f"}\nvariables: {name: a}\nsteps:\n  - title: One\n'
+    release_file.write_text(text)
+    app = ReleaseApp(config_path=release_file)
+
+    async def reload():
+        async with app.run_test() as pilot:
+            version = app.variables["version"]
+            release_file.write_text(text.replace("name: a", "name: b"))
+            app.reload_config()
+            await pilot.pause()
+            assert app.variables["version"] == version
+            assert app.variables["name"] == "b"
+
+    asyncio.run(reload())
+
+
+def test_cancel_waits_for_the_thread(tmp_path):
+    release_file = tmp_path / "release.yaml"
+    release_file.write_text(
+        'version: {from_time: "%Y"}\n'
+        "variables: {}\n"
+        "steps:\n"
+        "  - title: Slow\n"
+        "    python:\n"
+        "      code: __import__('time').sleep(1) or 'done'\n"
+        "    set_variable: slow\n"
+    )
+    app = ReleaseApp(config_path=release_file)
+
+    async def cancel():
+        async with app.run_test() as pilot:
+            await pilot.press("r")
+            await pilot.pause(0.1)
+            await pilot.press("escape")
+            await pilot.pause()
+            # the thread can't be interrupted, the step runs until it exits
+            assert app.step_statuses[0] == "Cancelling..."
+            await pilot.press("r")
+            assert app.running_step_index == 0
+            for _ in range(100):
+                if app.running_step_index is None:
+                    break
+                await pilot.pause(0.05)
+            assert app.running_step_index is None
+            assert app.step_statuses[0] == "Finished"
+            assert app.variables["slow"] == "done"
+
+    asyncio.run(cancel())
+
+
+def test_run_step_opens_its_url(tmp_path, monkeypatch):
+    opened = []
+    monkeypatch.setattr("webbrowser.open", opened.append)
+    release_file = tmp_path / "release.yaml"
+    release_file.write_text(
+        'version: {from_time: "%Y"}\n'
+        "variables: {}\n"
+        "steps:\n"
+        "  - title: Deploy\n"
+        "    run:\n"
+        "      command: echo deployed\n"
+        "    open_url: https://example.com/deployed\n"
+    )
+    app = ReleaseApp(config_path=release_file)
+
+    async def run():
+        async with app.run_test() as pilot:
+            await pilot.press("r")
+            for _ in range(50):
+                if app.step_statuses[0] == "Finished":
+                    break
+                await pilot.pause(0.05)
+            assert app.step_statuses[0] == "Finished"
+
+    asyncio.run(run())
+    assert opened == ["https://example.com/deployed"]
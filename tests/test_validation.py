@@ -0,0 +1,27 @@
+from release.config import ReleaseConfig
+from release.validation import analyze
+
+
+def get_severities(step: dict) -> dict:
+    config = ReleaseConfig.parse_obj(
+        {"version": {"from_time": "%Y"}, "variables": {}, "steps": [step]}
+    )
+    return {problem.name: problem.severity for problem in analyze(config)}
+
+
+def test_undefined_in_title_is_warning():
+    step = {
+        "title": "Release $missing",
+        "description": "Opens $also_missing",
+        "open_url": "https://example.com/$undefined",
+    }
+    assert get_severities(step) == {
+        "missing": "warning",
+        "also_missing": "warning",
+        "undefined": "error",
+    }
+
+
+def test_undefined_in_title_and_action_is_error():
+    step = {"title": "Open $missing", "open_url": "https://example.com/$missing"}
+    assert get_severities(step) == {"missing": "error"}